@@ -1,37 +1,20 @@
-import re
-import ndic
-from .tts import get_word_from_google
-
-
-def cleanup(txt):
-    """Remove all HTML, tags, and others."""
-    if not txt:
-        return ""
-    txt = re.sub(r"<.*?>", "", txt, flags=re.S)
-    txt = txt.replace("&nbsp;", " ")
-    txt = re.sub(r"^\s*", "", txt)
-    txt = re.sub(r"\s*$", "", txt)
-    # txt = re.sub(r"[\s+]", " ", txt)
-    txt = re.sub(r"\{\{c[0-9]+::(.*?)(::.*?)?\}\}", r"\1", txt)
-    return txt
-
+from typing import Dict
 
-def silhouette(hangul):
-    def insert_spaces(p):
-        r = ""
-        for i in p.group(0):
-            r += i + " "
-        return r[:-1]
+import ndic
+from .cache import Cache, DAY, USER_FILES_DIR
+from .text import cleanup, cleanup_many, silhouette
+from .tts import get_word_from_google, get_words_from_google
 
-    hangul_unicode = "[\u1100-\u11ff|\uAC00-\uD7AF|\u3130-\u318F]"
-    hangul = re.sub("{}+".format(hangul_unicode), insert_spaces, hangul)
-    txt = re.sub(hangul_unicode, "_", hangul)
-    return txt
+ndic_cache = Cache(USER_FILES_DIR / "ndic.sqlite", ttl=90 * DAY, negative_ttl=7 * DAY)
 
 
 def tts(korean) -> str:
     return get_word_from_google(korean)
 
 
+def tts_many(koreans) -> Dict[str, str]:
+    return get_words_from_google(koreans)
+
+
 def lookup(korean) -> str:
-    return ndic.search(korean)
+    return ndic_cache.get_or_compute(korean, ndic.search)
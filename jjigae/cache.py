@@ -0,0 +1,168 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Tuple
+
+ROOT_DIR = Path(os.path.dirname(os.path.abspath(__file__)))
+
+# Anki keeps the `user_files` folder of an add-on when updating it.
+USER_FILES_DIR = (ROOT_DIR.parent / "user_files").resolve()
+
+DAY = 24 * 60 * 60
+
+# Returned by `Cache.get` when there is no (fresh) entry for a key.
+MISSING = object()
+
+# Keys looked up per query by `Cache.get_many`, well under SQLite's limit on
+# query parameters.
+BATCH_SIZE = 500
+
+
+class Cache(object):
+    """
+    A persistent key/value cache backed by SQLite.
+
+    Entries expire after `ttl` seconds, or `negative_ttl` seconds for empty
+    values (lookups that found nothing), and once there are more than
+    `max_entries` of them, the least recently used ones are evicted. Every
+    thread gets its own connection, and the hit and miss counts add up across
+    threads.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        ttl: Optional[float] = None,
+        negative_ttl: Optional[float] = None,
+        max_entries: int = 100000,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value BLOB, created REAL, accessed REAL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def _expired(self, value, created: float, now: float) -> bool:
+        ttl = self.ttl if value else self.negative_ttl
+        return ttl is not None and now - created > ttl
+
+    def get(self, key: str):
+        now = self.clock()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value, created FROM cache WHERE key=?", (key,)
+        ).fetchone()
+        if row is None or self._expired(row[0], row[1], now):
+            self._count(0, 1)
+            return MISSING
+        conn.execute("UPDATE cache SET accessed=? WHERE key=?", (now, key))
+        self._count(1, 0)
+        return row[0]
+
+    def _count(self, hits: int, misses: int):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def get_many(self, keys: List[str]) -> list:
+        """
+        The value of each of `keys`, or `MISSING`, as `get` would return them,
+        with a query per batch of keys rather than per key.
+        """
+        now = self.clock()
+        conn = self._conn()
+        unique = list(dict.fromkeys(keys))
+        found = {}
+        for start in range(0, len(unique), BATCH_SIZE):
+            end = start + BATCH_SIZE
+            batch = unique[start:end]
+            params = ", ".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, value, created FROM cache WHERE key IN ({params})", batch
+            )
+            hits = [
+                (key, value)
+                for key, value, created in rows
+                if not self._expired(value, created, now)
+            ]
+            if hits:
+                conn.execute(
+                    "UPDATE cache SET accessed=? WHERE key IN ({})".format(
+                        ", ".join("?" * len(hits))
+                    ),
+                    [now] + [key for key, _ in hits],
+                )
+            found.update(hits)
+        values = [found.get(key, MISSING) for key in keys]
+        misses = values.count(MISSING)
+        self._count(len(keys) - misses, misses)
+        return values
+
+    def set(self, key: str, value):
+        self.set_many([(key, value)])
+
+    def set_many(self, items: Iterable[Tuple[str, object]]):
+        """Set many entries at once, in a single transaction."""
+        now = self.clock()
+        rows = [(key, value, now, now) for key, value in items]
+        if not rows:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)", rows)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        with self._lock:
+            writes = self._writes
+            self._writes += len(rows)
+        if (writes + len(rows)) // 100 > writes // 100:
+            self.evict()
+
+    def get_or_compute(self, key: str, compute: Callable[[str], object]):
+        value = self.get(key)
+        if value is MISSING:
+            value = compute(key)
+            self.set(key, value)
+        return value
+
+    def evict(self):
+        conn = self._conn()
+        (count,) = conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,266 @@
+"""
+Run prestudy and "Fill missing" from the command line, without Anki.
+
+    python -m jjigae.cli prestudy chapter1.txt chapter2.txt --output prestudy.apkg
+    python -m jjigae.cli fill collection.apkg --output filled.apkg
+
+Progress is streamed to stdout as JSON lines. Fill only updates notes of the
+jjigae note type: Anki skips importing a note whose guid it knows under
+another note type, so notes of other types are reported as skipped.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import zipfile
+import zlib
+from collections import Counter
+from functools import partial
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+import genanki
+
+from . import hanja, prestudy, tts
+from .instrumentation import cache_stats, metrics, profiled, write_report
+from .augmentation import cleanup, lookup, ndic_cache, silhouette, tts as get_sound
+from .models import ChineseDeck, KOREAN_NOTE_MODEL_ID, fields_list, get_model
+from .pipeline import FillPipeline
+from .text import SILHOUETTE_MODES
+
+
+def emit(event: str, **data):
+    print(json.dumps(dict(event=event, **data), ensure_ascii=False), flush=True)
+
+
+def _read_text(path: str) -> str:
+    if path == "-":
+        return sys.stdin.read()
+    return Path(path).read_text(encoding="utf-8")
+
+
+def _deck_id(name: str) -> int:
+    # Deck ids only need to be stable for a given name.
+    return (1 << 30) + zlib.crc32(name.encode("utf-8")) % (1 << 30)
+
+
+def _use_media_dir(media_dir, tmpdir: str):
+    tts.MEDIA_DIR = media_dir or os.path.join(tmpdir, "media")
+    os.makedirs(tts.MEDIA_DIR, exist_ok=True)
+
+
+def _package(deck: genanki.Deck, media_files: List[str], output: str):
+    genanki.Package(deck, media_files=media_files).write_to_file(output)
+
+
+def _media_files(sounds) -> List[str]:
+    return sorted(
+        {
+            os.path.join(tts.media_dir(), sound)
+            for sound in sounds
+            if sound and os.path.exists(os.path.join(tts.media_dir(), sound))
+        }
+    )
+
+
+def _write_report(kind: str, **data):
+    report = dict(kind=kind, **data, **metrics.report())
+    emit("report", path=str(write_report(kind, report)))
+
+
+def run_prestudy(args):
+    prestudy.token_cache.reset_stats()
+    counts = Counter()
+    for path in args.files:
+        file_counts = Counter()
+        for file_counts in prestudy.iter_count_words(
+            _read_text(path), processes=args.processes
+        ):
+            emit("progress", file=path, words=len(counts.keys() | file_counts.keys()))
+        counts.update(file_counts)
+
+    ranked = prestudy.rank_words(set(counts), args.min_difficulty)
+    if args.coverage is not None:
+        coverage = prestudy.Coverage(counts, ranked)
+        terms = coverage.terms[: coverage.study_count(args.coverage / 100)]
+    else:
+        terms = [term for position, term in ranked if position < args.max_vocab]
+    for term in terms:
+        emit(
+            "term",
+            word=term.word,
+            rank=term.rank,
+            difficulty=term.difficulty,
+            hanja=term.hanja,
+        )
+
+    if args.output:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _use_media_dir(args.media_dir, tmpdir)
+            deck = ChineseDeck(_deck_id(args.deck), args.deck, args.silhouette)
+            deck.add_terms(terms, tags=args.tags)
+            sounds = [note.fields[fields_list.index("Sound")] for note in deck.notes]
+            _package(deck, _media_files(sounds), args.output)
+    _write_report(
+        "prestudy",
+        words=len(counts),
+        terms=len(terms),
+        caches=dict(
+            tokens=cache_stats(prestudy.token_cache.hits, prestudy.token_cache.misses)
+        ),
+    )
+    emit("done", terms=len(terms), output=args.output)
+
+
+def _field_names(conn: sqlite3.Connection) -> Dict[int, List[str]]:
+    (models,) = conn.execute("SELECT models FROM col").fetchone()
+    models = json.loads(models) if models else {}
+    if models:
+        return {
+            int(mid): [f["name"] for f in sorted(m["flds"], key=lambda f: f["ord"])]
+            for mid, m in models.items()
+        }
+    # Newer collections keep their note types in separate tables.
+    names = {}
+    for ntid, name in conn.execute("SELECT ntid, name FROM fields ORDER BY ntid, ord"):
+        names.setdefault(ntid, []).append(name)
+    return names
+
+
+def read_notes(
+    path: str, tmpdir: str
+) -> Iterator[Tuple[str, int, List[str], Dict[str, str]]]:
+    """
+    Read the notes with a Korean field from an .apkg or a collection file, as
+    (guid, note type id, tags, fields by name) tuples.
+    """
+    if path.endswith(".apkg"):
+        with zipfile.ZipFile(path) as package:
+            names = package.namelist()
+            name = next(
+                n for n in ["collection.anki21", "collection.anki2"] if n in names
+            )
+            path = package.extract(name, tmpdir)
+
+    conn = sqlite3.connect(path)
+    try:
+        field_names = _field_names(conn)
+        for guid, mid, flds, tags in conn.execute(
+            "SELECT guid, mid, flds, tags FROM notes"
+        ):
+            names = field_names.get(mid, [])
+            if "Korean" in names:
+                yield guid, mid, tags.split(), dict(zip(names, flds.split("\x1f")))
+    finally:
+        conn.close()
+
+
+def run_fill(args):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _use_media_dir(args.media_dir, tmpdir)
+        notes = []
+        skipped = 0
+        for guid, mid, tags, note_dict in read_notes(args.collection, tmpdir):
+            if mid == KOREAN_NOTE_MODEL_ID:
+                notes.append((guid, tags, note_dict))
+            else:
+                skipped += 1
+        emit("start", notes=len(notes), skipped=skipped)
+
+        engine = FillPipeline(
+            cleanup=metrics.timed("cleanup", cleanup),
+            lookup=metrics.timed("ndic", lookup),
+            hanja=metrics.timed("hanja", hanja.lookup_many),
+            silhouette=metrics.timed(
+                "silhouette", partial(silhouette, mode=args.silhouette)
+            ),
+            tts=metrics.timed("tts", get_sound),
+        )
+        deck = ChineseDeck(_deck_id(args.deck), args.deck, args.silhouette)
+        items = (((guid, tags), note_dict) for guid, tags, note_dict in notes)
+
+        def on_error(key, field, error):
+            emit("error", guid=key[0], field=field, reason=str(error))
+
+        for done, ((guid, tags), note_dict) in enumerate(
+            engine.run(items, on_error=on_error), 1
+        ):
+            # Keep the guid, so that importing the deck updates the notes.
+            note = genanki.Note(
+                get_model(),
+                fields=[note_dict.get(name, "") for name in fields_list],
+                tags=tags,
+                guid=guid,
+            )
+            deck.add_note(note)
+            emit("note", done=done, total=len(notes), korean=note_dict["Korean"])
+
+        sounds = [note.fields[fields_list.index("Sound")] for note in deck.notes]
+        _package(deck, _media_files(sounds), args.output)
+        _write_report(
+            "fill",
+            notes=len(deck.notes),
+            lookups=dict(engine.lookups),
+            saved_lookups=dict(engine.saved),
+            caches=dict(ndic=cache_stats(ndic_cache.hits, ndic_cache.misses)),
+        )
+        emit(
+            "done",
+            notes=len(deck.notes),
+            skipped=skipped,
+            output=args.output,
+            cache_hits=ndic_cache.hits,
+            cache_misses=ndic_cache.misses,
+            saved_lookups=sum(engine.saved.values()),
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="jjigae", description=__doc__.strip())
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    p = commands.add_parser("prestudy", help="extract words to study from texts")
+    p.add_argument("files", nargs="*", default=["-"], help="text files, or - for stdin")
+    p.add_argument("--max-vocab", type=int, default=3500)
+    p.add_argument(
+        "--coverage",
+        type=float,
+        help="instead of --max-vocab, study the fewest words to understand this "
+        "percentage of the text",
+    )
+    p.add_argument("--min-difficulty", default="B", choices=["A", "B", "C"])
+    p.add_argument("--processes", type=int, default=None)
+    p.add_argument("--output", help="write the words as notes to this .apkg")
+    p.add_argument("--deck", default="Prestudy")
+    p.add_argument("--tags", nargs="*", default=[])
+    p.add_argument("--media-dir", help="where to save audio (default: temporary)")
+    p.set_defaults(run=run_prestudy)
+
+    f = commands.add_parser("fill", help="fill in missing fields of Korean notes")
+    f.add_argument("collection", help="an .apkg or a collection file")
+    f.add_argument("--output", required=True, help="write the notes to this .apkg")
+    f.add_argument("--deck", default="jjigae")
+    f.add_argument("--media-dir", help="where to save audio (default: temporary)")
+    f.set_defaults(run=run_fill)
+
+    for command in [p, f]:
+        command.add_argument(
+            "--profile", action="store_true", help="profile the run with cProfile"
+        )
+        command.add_argument(
+            "--silhouette", default=SILHOUETTE_MODES[0], choices=SILHOUETTE_MODES
+        )
+
+    args = parser.parse_args(argv)
+    with profiled(args.command, args.profile) as profile:
+        args.run(args)
+    if profile["profile"]:
+        emit("profile", path=profile["profile"])
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 from aqt import mw
 
 # import the "show info" tool from utils.py
-from aqt.utils import showInfo, askUserDialog
+from aqt.utils import showInfo, askUserDialog, tooltip
 
 # import all of the Qt GUI library
 from aqt.qt import QAction
@@ -10,84 +10,435 @@ from aqt.qt import QAction
 import ndic
 
 from anki.find import Finder
+from anki.hooks import addHook
+from anki.utils import ids2str, intTime
 
-from typing import Set
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 from . import models
 
 from . import hanja
+from . import instrumentation
+from . import lazy
+from . import prestudy
 
 from .ui import PrestudyDialog
-from .augmentation import cleanup, silhouette, tts, lookup
+from .augmentation import cleanup, silhouette, tts, lookup, ndic_cache
+from .enrichment import Enricher
+from .instrumentation import cache_stats, metrics, profiled, write_report
+from .journal import Journal, open_journal
+from .pipeline import FillPipeline, FIELDS
+from .text import silhouette_mode
+from .tts import refresh_manifest
 
 # We're going to add a menu item below. First we want to create a function to
 # be called when the menu item is activated.
 
 import re
+import time
+from functools import partial
 
+# Notes written back per transaction, unless set in the config.
+WRITE_CHUNK_SIZE = 200
 
-def write_back(note, note_dict, fields):
+# How long to wait after startup before warming up resources in the background.
+WARM_UP_DELAY_MS = 5000
+
+# How often to write back notes enriched in the background, and update the menu.
+ENRICHMENT_POLL_MS = 2000
+
+# Enriched notes are written back once no note was added or edited for this long.
+IDLE_SECONDS = 5
+
+ENRICHMENT_LABEL = "Enrich notes in background"
+
+
+def write_back(note, note_dict, fields) -> bool:
+    """
+    Copy `fields` from `note_dict` into `note`, returning whether anything changed.
+    """
+    changed = False
     for f in fields:
         if f in note_dict and note_dict[f] != note[f]:
             note[f] = note_dict[f]
-    note.flush()
-    return
+            changed = True
+    return changed
 
 
-def fill_missing():
-    notes = Finder(mw.col).findNotes("deck:current")
-    mw.progress.start(immediate=True, min=0, max=len(notes))
-    scanned = 0
-    for noteId in notes:
-        scanned += 1
-        note = mw.col.getNote(noteId)
-        note_dict = dict(note)
+class BatchWriter(object):
+    """
+    Accumulates dirty notes and commits them to the collection in chunks, each
+    in a single transaction, instead of flushing notes one by one.
 
-        if "Korean" in note_dict:
-            korean = cleanup(note_dict["Korean"])
+    Every committed chunk is durable, so a pass that gets interrupted loses at
+    most the notes of the current chunk, and since filling only ever touches
+    empty fields, running it again simply picks those up. `on_commit` is called
+    after every commit, so that the fill journal can follow.
+    """
 
-            if "English" in note_dict and cleanup(note_dict["English"]) == "":
-                mw.progress.update(label=f"[{korean}] Translating...", value=scanned)
-                english = cleanup(note_dict["English"])
-                if korean != "" and english == "":
-                    translation = lookup(korean)
-                    note_dict["Korean"] = korean
-                    note_dict["English"] = translation
+    def __init__(
+        self,
+        col,
+        chunk_size: int = WRITE_CHUNK_SIZE,
+        on_commit: Optional[Callable[[], None]] = None,
+    ):
+        self.col = col
+        self.chunk_size = chunk_size
+        self.on_commit = on_commit
+        self.dirty = []
+        self.written = 0
+        self.skipped = 0
 
-            if "Hanja" in note_dict and cleanup(note_dict["Hanja"]) == "":
-                mw.progress.update(
-                    label=f"[{korean}] Looking up Hanja...", value=scanned
-                )
-                found = hanja.lookup(korean)
-                if found is not None:
-                    note_dict["Hanja"] = found["hanja"]
+    def add(self, note, note_dict, fields):
+        with metrics.timer("write_back"):
+            changed = write_back(note, note_dict, fields)
+        if not changed:
+            self.skipped += 1
+            return
+        self.dirty.append(note)
+        if len(self.dirty) >= self.chunk_size:
+            self.commit()
 
-            if "Silhouette" in note_dict and cleanup(note_dict["Silhouette"]) == "":
-                mw.progress.update(
-                    label=f"[{korean}] Processing silhouette...", value=scanned
-                )
-                note_dict["Silhouette"] = silhouette(korean)
+    def commit(self):
+        if self.dirty:
+            with metrics.timer("commit"):
+                mod = intTime()
+                for note in self.dirty:
+                    note.flush(mod=mod)
+                self.col.save()
+            self.written += len(self.dirty)
+            self.dirty = []
+        if self.on_commit is not None:
+            self.on_commit()
+
+
+def _fill(
+    nids: List[int], journal: Journal, run: Optional[int], chunk_size: int, kind: str
+) -> dict:
+    """
+    Fill in the notes `nids`, recording them in `journal` as part of `run`.
+    Returns a report of the run, as written by `_finish`.
+    """
+    mw.progress.start(immediate=True, min=0, max=len(nids))
+    refresh_manifest()
+    loaded = {}
+    errors: Dict[int, Dict[str, str]] = {}
+
+    def note_dicts():
+        for nid in nids:
+            note = mw.col.getNote(nid)
+            loaded[nid] = note
+            yield nid, dict(note)
 
-            if "Sound" in note_dict and cleanup(note_dict["Sound"]) == "":
+    def on_error(nid, field, error):
+        errors.setdefault(nid, {})[field] = f"{type(error).__name__}: {error}"
+
+    engine = FillPipeline(
+        cleanup=metrics.timed("cleanup", cleanup),
+        lookup=metrics.timed("ndic", lookup),
+        hanja=metrics.timed("hanja", hanja.lookup_many),
+        silhouette=metrics.timed(
+            "silhouette", partial(silhouette, mode=silhouette_mode(config()))
+        ),
+        tts=metrics.timed("tts", tts),
+    )
+    writer = BatchWriter(mw.col, chunk_size, on_commit=journal.commit)
+    metrics.reset()
+    ndic_cache.reset_stats()
+    cleanup.cache_clear()
+    scanned = 0
+    failed = 0
+    with profiled(kind, config().get("profile_runs", False)) as profile:
+        try:
+            for nid, note_dict in engine.run(
+                note_dicts(), tick=mw.progress.update, on_error=on_error
+            ):
+                note = loaded.pop(nid)
+                scanned += 1
                 mw.progress.update(
-                    label=f"[{korean}] Looking up sound...", value=scanned
+                    label=f"[{note_dict.get('Korean', '')}] Filled in", value=scanned
                 )
-                note_dict["Sound"] = tts(korean)
+                if "Korean" in note_dict:
+                    writer.add(note, note_dict, FIELDS)
+                note_errors = errors.pop(nid, {})
+                failed += bool(note_errors)
+                journal.record(run, nid, note_errors)
+                if journal.pending >= chunk_size:
+                    writer.commit()
+        finally:
+            writer.commit()
+            mw.progress.finish()
+
+    cleanup_info = cleanup.cache_info()
+    return dict(
+        kind=kind,
+        notes=dict(scanned=scanned, updated=writer.written, failed=failed),
+        lookups=dict(engine.lookups),
+        saved_lookups=dict(engine.saved),
+        caches=dict(
+            ndic=cache_stats(ndic_cache.hits, ndic_cache.misses),
+            cleanup=cache_stats(cleanup_info.hits, cleanup_info.misses),
+        ),
+        load_times=dict(lazy.load_times),
+        profile=profile["profile"],
+        **metrics.report(),
+    )
+
+
+def _finish(report: dict, summary: str):
+    """
+    Write the report of a run, and show `summary` along with it, in a dialog
+    if enabled in the config, or a tooltip otherwise.
+    """
+    path = write_report(report["kind"], report)
+    if config().get("run_summary"):
+        showInfo(
+            f"{summary}\n\n{instrumentation.summary(report)}\n\nReport: {path}",
+            title="jjigae",
+            textFormat="plain",
+        )
+    else:
+        tooltip(summary.replace("\n", "<br>"))
+
+
+def _lookup_summary(report: dict) -> str:
+    cache = report["caches"]["ndic"]
+    return (
+        f"Dictionary cache: {cache['hits']} hits, {cache['misses']} misses.\n"
+        f"Saved {sum(report['saved_lookups'].values())} duplicate lookups."
+    )
+
+
+def fill_missing(chunk_size: Optional[int] = None):
+    """
+    Fill in the notes of the current deck, picking up where the last run on the
+    deck left off if it didn't finish.
+    """
+    chunk_size = chunk_size or write_chunk_size()
+    journal = open_journal()
+    try:
+        run = journal.start(f"deck:{mw.col.decks.selected()}")
+        done = journal.processed(run)
+        nids = [
+            nid for nid in Finder(mw.col).findNotes("deck:current") if nid not in done
+        ]
+        report = _fill(nids, journal, run, chunk_size, "fill")
+        journal.finish(run)
+    finally:
+        journal.close()
+
+    notes = report["notes"]
+    summary = f"Updated {notes['updated']} of {notes['scanned']} notes"
+    if done:
+        summary += f", resuming after {len(done)} notes"
+    summary += ".\n"
+    if notes["failed"]:
+        summary += f'{notes["failed"]} notes failed, run "Retry failed" later.\n'
+    _finish(report, summary + _lookup_summary(report))
+
+
+def retry_failed(chunk_size: Optional[int] = None):
+    """
+    Fill in again the notes that failed to fill, once their backoff is over.
+    """
+    chunk_size = chunk_size or write_chunk_size()
+    journal = open_journal()
+    try:
+        failures = journal.failures()
+        existing = set(
+            mw.col.db.list(f"SELECT id FROM notes WHERE id IN {ids2str(failures)}")
+        )
+        journal.forget(set(failures) - existing)
+        nids = [nid for nid in journal.failures(due=True) if nid in existing]
+        report = _fill(nids, journal, None, chunk_size, "retry")
+    finally:
+        journal.close()
+
+    notes = report["notes"]
+    summary = (
+        f"Retried {notes['scanned']} notes, updated {notes['updated']}, "
+        f"{notes['failed']} still failing."
+    )
+    waiting = len(existing) - notes["scanned"]
+    if waiting:
+        summary += f"\n{waiting} notes will be retried later."
+    _finish(report, summary + "\n" + _lookup_summary(report))
 
-            write_back(
-                note, note_dict, ["Korean", "English", "Hanja", "Silhouette", "Sound"]
+
+def config() -> dict:
+    return mw.addonManager.getConfig(__name__) or {}
+
+
+def set_config(**options):
+    mw.addonManager.writeConfig(__name__, dict(config(), **options))
+
+
+def write_chunk_size() -> int:
+    """The number of notes to write back per transaction, from the config."""
+    size = config().get("write_chunk_size", WRITE_CHUNK_SIZE)
+    if not isinstance(size, int) or size < 1:
+        print(f"jjigae: invalid write_chunk_size {size!r}, using {WRITE_CHUNK_SIZE}")
+        return WRITE_CHUNK_SIZE
+    return size
+
+
+def notes_in_editors() -> Set[int]:
+    """
+    The ids of the notes open in an editor, in the Browser, "Edit" or "Add"
+    window, which would write their own copy of the note back on save.
+    """
+    nids = set()
+    for window in mw.app.topLevelWidgets():
+        note = getattr(getattr(window, "editor", None), "note", None)
+        if note is not None and note.id:
+            nids.add(note.id)
+    return nids
+
+
+class BackgroundEnrichment(object):
+    """
+    Queues notes for `Enricher` as they are added or edited, when enabled in
+    the add-on config, and writes them back in batches while the user is idle.
+    """
+
+    def __init__(self, action: QAction):
+        self.action = action
+        self.enricher = Enricher(
+            FillPipeline(
+                cleanup=cleanup,
+                lookup=lookup,
+                hanja=hanja.lookup_many,
+                silhouette=silhouette,
+                tts=tts,
+                max_workers=2,
+                limits={"ndic": 1, "tts": 1},
+            )
+        )
+        self.last_activity = 0.0
+        self.enabled = False
+        # Enriched notes that were open in an editor, to write back later.
+        self.deferred: Dict[int, Dict[str, str]] = {}
+
+    def configure(self, config: dict):
+        self.enabled = bool(config.get("background_enrichment"))
+        self.enricher.pipeline.silhouette = partial(
+            silhouette, mode=silhouette_mode(config)
+        )
+        if self.enabled:
+            self.enricher.start()
+        self.update_action()
+
+    def toggle(self, enabled: bool):
+        if enabled != self.enabled:
+            set_config(background_enrichment=enabled)
+            self.configure(config())
+
+    def submit(self, note):
+        if not self.enabled or not note.id or "Korean" not in note:
+            return
+        note_dict = dict(note)
+        if cleanup(note_dict["Korean"]) == "":
+            return
+        if all(cleanup(note_dict[f]) != "" for f in FIELDS if f in note_dict):
+            return
+        self.last_activity = time.monotonic()
+        self.enricher.start()
+        self.enricher.submit(note.id, note_dict)
+
+    def on_note_added(self, note):
+        self.submit(note)
+
+    def on_focus_lost(self, changed, note, field_index):
+        self.submit(note)
+        return changed
+
+    def write_back(self):
+        """
+        Write back the notes enriched so far, filling in only fields that are
+        still empty, and skipping notes whose Korean has changed meanwhile.
+        Notes open in an editor are left for a later write back.
+        """
+        writer = BatchWriter(mw.col, write_chunk_size())
+        pending, self.deferred = self.deferred, {}
+        pending.update(self.enricher.results())
+        editing = notes_in_editors()
+        for nid, note_dict in pending.items():
+            if "Korean" not in note_dict or not mw.col.db.scalar(
+                "SELECT 1 FROM notes WHERE id = ?", nid
+            ):
+                continue
+            if nid in editing:
+                self.deferred[nid] = note_dict
+                continue
+            note = mw.col.getNote(nid)
+            if cleanup(note["Korean"]) != cleanup(note_dict["Korean"]):
+                continue
+            fields = [
+                f
+                for f in FIELDS
+                if f != "Korean" and f in note and cleanup(note[f]) == ""
+            ]
+            writer.add(note, note_dict, fields)
+        writer.commit()
+        if writer.written:
+            mw.requireReset()
+
+    def poll(self):
+        idle = time.monotonic() - self.last_activity >= IDLE_SECONDS
+        if mw.col is not None and idle and not mw.progress.busy():
+            self.write_back()
+        self.update_action()
+
+    def update_action(self):
+        depth = self.enricher.depth + len(self.deferred)
+        if self.enabled and depth:
+            self.action.setText(
+                f"{ENRICHMENT_LABEL} ({depth} queued, "
+                f"{self.enricher.lag:.0f}s behind)"
             )
+        elif self.enabled and self.enricher.latencies:
+            self.action.setText(
+                f"{ENRICHMENT_LABEL} (up to date, "
+                f"{self.enricher.latency:.0f}s per note)"
+            )
+        else:
+            self.action.setText(ENRICHMENT_LABEL)
+        self.action.setChecked(self.enabled)
+
+
+def report_load_time(name, seconds):
+    print(f"jjigae: loaded {name} in {seconds:.2f}s")
 
-        print(note_dict)
 
-    mw.progress.finish()
+def warm_up():
+    # Okt starts a JVM, so it's only warmed up once the prestudy dialog opens.
+    if config().get("warm_up"):
+        lazy.warm_up([prestudy._vocab, hanja.index])
 
 
 def load():
+    lazy.add_load_hook(report_load_time)
+    mw.progress.timer(WARM_UP_DELAY_MS, warm_up, False)
+
     menu = mw.form.menuTools.addMenu("jjigae")
     action = QAction("Fill missing", mw)
-    action.triggered.connect(fill_missing)
+    action.triggered.connect(lambda: fill_missing())
+    retry_action = QAction("Retry failed", mw)
+    retry_action.triggered.connect(lambda: retry_failed())
     xaction = QAction("Prestudy", mw)
     xaction.triggered.connect(PrestudyDialog.instantiate_and_run)
     menu.addAction(action)
+    menu.addAction(retry_action)
     menu.addAction(xaction)
+
+    enrichment_action = QAction(ENRICHMENT_LABEL, mw, checkable=True)
+    enrichment = BackgroundEnrichment(enrichment_action)
+    enrichment.configure(config())
+    enrichment_action.toggled.connect(enrichment.toggle)
+    mw.addonManager.setConfigUpdatedAction(__name__, enrichment.configure)
+    menu.addAction(enrichment_action)
+
+    addHook("AddCards.noteAdded", enrichment.on_note_added)
+    addHook("editFocusLost", enrichment.on_focus_lost)
+    addHook("unloadProfile", enrichment.write_back)
+    mw.progress.timer(ENRICHMENT_POLL_MS, enrichment.poll, True)
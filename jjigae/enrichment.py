@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Tuple
+
+from .pipeline import FillPipeline
+
+# Notes taken off the queue at once.
+BATCH_SIZE = 20
+
+# Pause between batches, so that the worker never hogs the network or the GIL.
+PAUSE = 0.5
+
+# How many recent latencies to average over.
+LATENCY_SAMPLES = 50
+
+
+class Enricher(object):
+    """
+    Fills in missing fields of notes in the background, as they are added or
+    edited, on a single worker thread.
+
+    Notes are submitted as (key, note_dict) snapshots, and a note submitted
+    again before it is picked up just replaces its snapshot. Filled in notes
+    wait in `results()` until the caller is ready to write them back.
+    """
+
+    def __init__(
+        self,
+        pipeline: FillPipeline,
+        batch_size: int = BATCH_SIZE,
+        pause: float = PAUSE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.pipeline = pipeline
+        self.batch_size = batch_size
+        self.pause = pause
+        self.clock = clock
+        self.errors = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Condition()
+        # key -> (note_dict, time queued)
+        self._queued: "OrderedDict[object, Tuple[Dict[str, str], float]]" = (
+            OrderedDict()
+        )
+        self._working: Dict[object, float] = {}
+        self._done: List[Tuple[object, Dict[str, str], float]] = []
+        self._thread = None
+        self._stopping = False
+
+    def submit(self, key, note_dict: Dict[str, str]):
+        with self._lock:
+            _, queued_at = self._queued.pop(key, (None, self.clock()))
+            self._queued[key] = (note_dict, queued_at)
+            self._lock.notify()
+
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(
+                target=self._work, name="jjigae-enrichment", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopping = True
+            self._lock.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _take(self) -> Dict[object, Tuple[Dict[str, str], float]]:
+        with self._lock:
+            while not self._queued and not self._stopping:
+                self._lock.wait()
+            batch = {}
+            while self._queued and len(batch) < self.batch_size:
+                key, item = self._queued.popitem(last=False)
+                batch[key] = item
+            self._working = {key: queued_at for key, (_, queued_at) in batch.items()}
+            return batch
+
+    def _work(self):
+        while not self._stopping:
+            batch = self._take()
+            items = [(key, note_dict) for key, (note_dict, _) in batch.items()]
+            try:
+                done = [
+                    (key, note_dict, batch[key][1])
+                    for key, note_dict in self.pipeline.run(
+                        items, on_error=self._on_error
+                    )
+                ]
+            except Exception as e:
+                # Leave these notes for "Fill missing".
+                print(f"jjigae: background enrichment failed: {e}")
+                done = []
+                self.errors += len(batch)
+            with self._lock:
+                self._done.extend(done)
+                self._working = {}
+            time.sleep(self.pause)
+
+    def _on_error(self, key, field: str, error: Exception):
+        # The field stays empty, for "Fill missing" to pick up.
+        self.errors += 1
+
+    def results(self) -> List[Tuple[object, Dict[str, str]]]:
+        """
+        Take the notes filled in so far, as (key, note_dict) pairs.
+        """
+        with self._lock:
+            done, self._done = self._done, []
+        now = self.clock()
+        self.latencies.extend(now - queued_at for _, _, queued_at in done)
+        return [(key, note_dict) for key, note_dict, _ in done]
+
+    @property
+    def depth(self) -> int:
+        """Notes submitted but not yet taken from `results()`."""
+        with self._lock:
+            return len(self._queued) + len(self._working) + len(self._done)
+
+    @property
+    def lag(self) -> float:
+        """Seconds since the oldest note still in the queue was submitted."""
+        with self._lock:
+            pending = [queued_at for _, queued_at in self._queued.values()]
+            pending += self._working.values()
+            pending += [queued_at for _, _, queued_at in self._done]
+        return self.clock() - min(pending) if pending else 0.0
+
+    @property
+    def latency(self) -> float:
+        """Average seconds from submitting a note to taking it back, lately."""
+        return sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
@@ -1,22 +1,92 @@
 import sqlite3
+import threading
 from pathlib import Path
 import os
+from typing import Dict, Iterable, List
+
+from .cache import USER_FILES_DIR
+from .lazy import Lazy
 
 ROOT_DIR = Path(os.path.dirname(os.path.abspath(__file__)))
 
 path = (ROOT_DIR / "hanjadic.sqlite").resolve()
 
-if not path.exists():
-    raise Exception(f"Can't find Hanja DB: {path}")
+# `hanjas` is an FTS3 table, which can't be indexed on `hangul`, so we keep a
+# covering lookup table next to the user's files instead.
+index_path = USER_FILES_DIR / "hanja_index.sqlite"
+
+MMAP_SIZE = 64 * 1024 * 1024
+
+# SQLite limits the number of parameters in a single query.
+MAX_PARAMS = 500
+
+_local = threading.local()
+
+
+def _build_index():
+    if not path.exists():
+        raise Exception(f"Can't find Hanja DB: {path}")
+
+    stat = path.stat()
+    source = f"{stat.st_size}:{stat.st_mtime_ns}"
+    USER_FILES_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(index_path))
+    try:
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (source TEXT)")
+            if conn.execute("SELECT source FROM meta").fetchone() == (source,):
+                return
+            conn.execute("DROP TABLE IF EXISTS hanjas")
+            conn.execute(
+                "CREATE TABLE hanjas (hangul TEXT PRIMARY KEY, hanja TEXT) "
+                "WITHOUT ROWID"
+            )
+            # A plain path: ATTACH only takes a URI when SQLite was built to.
+            conn.execute("ATTACH DATABASE ? AS dictionary", (str(path),))
+            # Keep the first match of each word, like a scan of the dictionary.
+            conn.execute(
+                "INSERT OR IGNORE INTO hanjas "
+                "SELECT hangul, hanja FROM dictionary.hanjas ORDER BY docid"
+            )
+            conn.execute("DELETE FROM meta")
+            conn.execute("INSERT INTO meta VALUES (?)", (source,))
+    finally:
+        conn.close()
+
+
+index = Lazy("hanja", _build_index)
+
+
+def connection() -> sqlite3.Connection:
+    """
+    This thread's read-only connection to the lookup table.
+    """
+    index.get()
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(index_path.as_uri() + "?mode=ro&immutable=1", uri=True)
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        _local.conn = conn
+    return conn
 
-conn = sqlite3.connect(str(path))
 
-c = conn.cursor()
+def lookup_many(hangeuls: Iterable[str]) -> Dict[str, dict]:
+    """
+    Look up many words at once, returning the ones that were found.
+    """
+    conn = connection()
+    words: List[str] = list(set(hangeuls))
+    found = {}
+    for start in range(0, len(words), MAX_PARAMS):
+        end = start + MAX_PARAMS
+        batch = words[start:end]
+        params = ", ".join("?" * len(batch))
+        for hangul, hanja in conn.execute(
+            f"SELECT hangul, hanja FROM hanjas WHERE hangul IN ({params})", batch
+        ):
+            found[hangul] = {"hanja": hanja}
+    return found
 
 
 def lookup(hangeul):
-    t = (hangeul,)
-    c.execute("SELECT * FROM hanjas WHERE hangul=?", t)
-    res = c.fetchone()
-    if res is not None:
-        return {"hanja": res[0]}
+    return lookup_many([hangeul]).get(hangeul)
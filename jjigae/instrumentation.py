@@ -0,0 +1,210 @@
+"""
+Latency histograms per stage, error counts and cache hit rates for fill and
+prestudy runs, written out as a JSON report at the end of each run.
+"""
+
+import cProfile
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional
+
+from .cache import USER_FILES_DIR
+
+REPORTS_DIR = USER_FILES_DIR / "reports"
+
+# How many reports of each kind to keep.
+KEEP_REPORTS = 20
+
+# Upper bounds of the histogram buckets, in seconds: 10µs doubling up to ~80s.
+BUCKETS = [1e-5 * 2**i for i in range(24)]
+
+
+class Histogram(object):
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> float:
+        """
+        An upper bound on the `q` quantile, from the bucket it falls in.
+        """
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        ms = 1000
+        return {
+            "count": self.count,
+            "total_ms": self.total * ms,
+            "mean_ms": self.total / self.count * ms if self.count else 0.0,
+            "min_ms": self.min * ms if self.count else 0.0,
+            "p50_ms": self.percentile(0.5) * ms,
+            "p90_ms": self.percentile(0.9) * ms,
+            "p99_ms": self.percentile(0.99) * ms,
+            "max_ms": self.max * ms,
+            "buckets": {
+                f"<={BUCKETS[i] * ms:g}ms" if i < len(BUCKETS) else "more": n
+                for i, n in enumerate(self.buckets)
+                if n
+            },
+        }
+
+
+class Metrics(object):
+    """
+    Latency histograms and error counts per stage, which can be recorded from
+    any thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, Histogram] = {}
+        self.errors = Counter()
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            if stage not in self.stages:
+                self.stages[stage] = Histogram()
+            self.stages[stage].record(seconds)
+
+    def error(self, stage: str):
+        with self._lock:
+            self.errors[stage] += 1
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.error(stage)
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def timed(self, stage: str, fn: Callable) -> Callable:
+        @wraps(fn)
+        def timed_fn(*args, **kwargs):
+            with self.timer(stage):
+                return fn(*args, **kwargs)
+
+        return timed_fn
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.errors = Counter()
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "stages": {
+                    stage: histogram.to_dict()
+                    for stage, histogram in sorted(self.stages.items())
+                },
+                "errors": dict(self.errors),
+            }
+
+
+# What the current run records into.
+metrics = Metrics()
+
+
+def cache_stats(hits: int, misses: int) -> dict:
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / lookups if lookups else None,
+    }
+
+
+def _report_path(kind: str, suffix: str, directory: Path) -> Path:
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    return directory / f"{kind}-{stamp}{suffix}"
+
+
+def _prune(kind: str, suffix: str, directory: Path, keep: int):
+    for old in sorted(directory.glob(f"{kind}-*{suffix}"))[:-keep]:
+        old.unlink()
+
+
+def write_report(
+    kind: str, report: dict, directory: Path = REPORTS_DIR, keep: int = KEEP_REPORTS
+) -> Path:
+    """
+    Write `report` as `<kind>-<time>.json` in `directory`, keeping only the
+    latest `keep` reports of that kind.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    path = _report_path(kind, ".json", directory)
+    path.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    _prune(kind, ".json", directory, keep)
+    return path
+
+
+@contextmanager
+def profiled(
+    kind: str, enabled: bool, directory: Path = REPORTS_DIR
+) -> Iterator[Dict[str, Optional[str]]]:
+    """
+    When `enabled`, profile the calling thread with cProfile, and save the stats
+    as `<kind>-<time>.prof` in `directory`, for `python -m pstats` or snakeviz.
+    Yields a dict whose "profile" is set to the path of the stats.
+    """
+    result: Dict[str, Optional[str]] = {"profile": None}
+    if not enabled:
+        yield result
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield result
+    finally:
+        profile.disable()
+        directory.mkdir(parents=True, exist_ok=True)
+        path = _report_path(kind, ".prof", directory)
+        profile.dump_stats(str(path))
+        _prune(kind, ".prof", directory, KEEP_REPORTS)
+        result["profile"] = str(path)
+
+
+def summary(report: dict) -> str:
+    """A plain text summary of a report."""
+    lines = [f"{'stage':<12} {'count':>7} {'mean':>9} {'p90':>9} {'max':>9}"]
+    for stage, h in report["stages"].items():
+        lines.append(
+            f"{stage:<12} {h['count']:>7} {h['mean_ms']:>7.1f}ms"
+            f" {h['p90_ms']:>7.1f}ms {h['max_ms']:>7.1f}ms"
+        )
+    for name, stats in report.get("caches", {}).items():
+        rate = stats["hit_rate"]
+        rate = "-" if rate is None else f"{rate:.0%}"
+        lines.append(
+            f"{name} cache: {stats['hits']} hits, {stats['misses']} misses ({rate})"
+        )
+    for stage, n in report["errors"].items():
+        lines.append(f"{stage} errors: {n}")
+    return "\n".join(lines)
@@ -0,0 +1,169 @@
+import sqlite3
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from .cache import DAY
+
+# Wait before retrying a failed field, doubling with every attempt.
+BACKOFF = 60
+
+MAX_BACKOFF = DAY
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    scope TEXT NOT NULL,
+    started REAL NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS processed (
+    run INTEGER NOT NULL,
+    nid INTEGER NOT NULL,
+    PRIMARY KEY (run, nid)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS failures (
+    nid INTEGER NOT NULL,
+    field TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    retry_at REAL NOT NULL,
+    PRIMARY KEY (nid, field)
+) WITHOUT ROWID;
+"""
+
+
+class Journal(object):
+    """
+    Keeps track of fill runs, so that an interrupted run picks up where it left
+    off, and of the fields that failed to fill, so that they can be retried with
+    backoff.
+
+    A run covers a scope, such as a deck. Until it is finished, starting a run
+    on the same scope resumes it, and the notes it has already processed can be
+    skipped. Records only become durable on `commit()`, which the caller should
+    do right after writing the notes back, so that the journal never gets ahead
+    of the collection.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        backoff: float = BACKOFF,
+        max_backoff: float = MAX_BACKOFF,
+        clock: Callable[[], float] = time.time,
+    ):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path))
+        self.conn.executescript(SCHEMA)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.pending = 0
+
+    def start(self, scope: str) -> int:
+        """The id of the unfinished run on `scope`, or of a new one."""
+        row = self.conn.execute(
+            "SELECT id FROM runs WHERE scope = ? AND finished IS NULL", (scope,)
+        ).fetchone()
+        if row is not None:
+            return row[0]
+        cursor = self.conn.execute(
+            "INSERT INTO runs (scope, started) VALUES (?, ?)", (scope, self.clock())
+        )
+        self.conn.commit()
+        return cursor.lastrowid
+
+    def processed(self, run: int) -> Set[int]:
+        return {
+            nid
+            for (nid,) in self.conn.execute(
+                "SELECT nid FROM processed WHERE run = ?", (run,)
+            )
+        }
+
+    def record(self, run: Optional[int], nid: int, errors: Dict[str, str]):
+        """
+        Record that a note went through a run (or a retry, without `run`),
+        with the reason each of its failed fields failed. Fields that didn't
+        fail this time are cleared from the failures.
+        """
+        if run is not None:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO processed (run, nid) VALUES (?, ?)", (run, nid)
+            )
+        fields = list(errors)
+        self.conn.execute(
+            "DELETE FROM failures WHERE nid = ? AND field NOT IN ({})".format(
+                ", ".join("?" * len(fields))
+            ),
+            [nid] + fields,
+        )
+        now = self.clock()
+        for field, reason in errors.items():
+            self.conn.execute(
+                """
+                INSERT INTO failures (nid, field, reason, attempts, retry_at)
+                VALUES (:nid, :field, :reason, 1, :now + :backoff)
+                ON CONFLICT (nid, field) DO UPDATE SET
+                    reason = excluded.reason,
+                    attempts = attempts + 1,
+                    retry_at = :now + min(:backoff * (1 << attempts), :max_backoff)
+                """,
+                dict(
+                    nid=nid,
+                    field=field,
+                    reason=reason,
+                    now=now,
+                    backoff=self.backoff,
+                    max_backoff=self.max_backoff,
+                ),
+            )
+        self.pending += 1
+
+    def commit(self):
+        self.conn.commit()
+        self.pending = 0
+
+    def finish(self, run: int):
+        self.conn.execute(
+            "UPDATE runs SET finished = ? WHERE id = ?", (self.clock(), run)
+        )
+        self.conn.execute("DELETE FROM processed WHERE run = ?", (run,))
+        self.conn.commit()
+
+    def close(self):
+        """Close the journal, dropping anything not committed."""
+        self.conn.close()
+
+    def failures(self, due: bool = False) -> Dict[int, Dict[str, str]]:
+        """
+        Failed fields by note, with the reason they failed. When `due`, only
+        those whose backoff is over.
+        """
+        query = "SELECT nid, field, reason FROM failures"
+        params: List[float] = []
+        if due:
+            query += " WHERE retry_at <= ?"
+            params.append(self.clock())
+        failures = {}
+        for nid, field, reason in self.conn.execute(query, params):
+            failures.setdefault(nid, {})[field] = reason
+        return failures
+
+    def forget(self, nids: Iterable[int]):
+        """Drop the failures of notes that no longer exist."""
+        self.conn.executemany(
+            "DELETE FROM failures WHERE nid = ?", [(nid,) for nid in nids]
+        )
+        self.conn.commit()
+
+
+def open_journal() -> Journal:
+    """
+    The journal of the current profile, kept in its folder, since note and
+    deck ids are only unique within a collection.
+    """
+    from aqt import mw
+
+    return Journal(Path(mw.pm.profileFolder()) / "jjigae_fill_journal.sqlite")
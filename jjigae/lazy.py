@@ -0,0 +1,66 @@
+import threading
+import time
+from typing import Callable, Dict, Generic, Iterable, List, TypeVar
+
+T = TypeVar("T")
+
+# How long each resource took to load, in seconds, by name.
+load_times: Dict[str, float] = {}
+
+_load_hooks: List[Callable[[str, float], None]] = []
+
+
+def add_load_hook(hook: Callable[[str, float], None]):
+    """
+    Register `hook(name, seconds)` to be called whenever a resource is loaded.
+    """
+    _load_hooks.append(hook)
+
+
+class Lazy(Generic[T]):
+    """
+    A resource that is only loaded the first time it is needed, from whichever
+    thread gets there first.
+    """
+
+    def __init__(self, name: str, loader: Callable[[], T]):
+        self.name = name
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._value = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self) -> T:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    start = time.perf_counter()
+                    self._value = self._loader()
+                    self._loaded = True
+                    elapsed = time.perf_counter() - start
+                    load_times[self.name] = elapsed
+                    for hook in _load_hooks:
+                        hook(self.name, elapsed)
+        return self._value
+
+
+def warm_up(resources: Iterable[Lazy]) -> threading.Thread:
+    """
+    Load `resources` one after the other on a background thread.
+    """
+
+    def run():
+        for resource in resources:
+            try:
+                resource.get()
+            except Exception as e:
+                # It will be retried, and fail loudly, on first use.
+                print(f"jjigae: failed to warm up {resource.name}: {e}")
+
+    thread = threading.Thread(target=run, name="jjigae-warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -8,13 +8,21 @@
 # License: GNU GPL, version 3 or later; http://www.gnu.org/copyleft/gpl.html
 #
 
-import anki.stdmodels
-from anki.lang import _
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List
+
+try:
+    import anki.stdmodels
+    from anki.lang import _
+except ImportError:
+    # Running headless, outside of Anki.
+    anki = None
 
 import genanki
 from genanki import Model, Note, Deck
 
-from .augmentation import lookup, tts, silhouette as get_silhouette
+from .augmentation import lookup, tts, tts_many, silhouette as get_silhouette
 from .prestudy import Term
 from .css import style
 from .card_fields import (
@@ -53,7 +61,11 @@ model_name = "Korean (jjigae)"
 
 KOREAN_NOTE_MODEL_ID = 2828501749
 
+# How many dictionary lookups to run at once when adding notes in bulk.
+MAX_WORKERS = 8
+
 
+@lru_cache(maxsize=None)
 def get_model() -> Model:
     return Model(
         KOREAN_NOTE_MODEL_ID,
@@ -88,27 +100,43 @@ class KoreanNote(Note):
 
 
 class ChineseDeck(Deck):
-    def __init__(self, deck_id=None, name=None):
+    def __init__(self, deck_id=None, name=None, silhouette_mode="underscores"):
         super().__init__(deck_id, name)
+        self.silhouette_mode = silhouette_mode
 
-    def add_term(self, term: Term, tags=[]):
+    def _add_note(self, term: Term, translation: str, sound: str, tags):
         the_comment = ""
-        the_comment += term.notes
+        the_comment += term.notes or ""
         the_comment += " (amb)" if term.ambiguous else ""
 
         note = KoreanNote(
             fields=[
                 term.word,
-                lookup(term.word),
-                term.hanja,
-                tts(term.word),
-                get_silhouette(term.word),
+                translation,
+                term.hanja or "",
+                sound,
+                get_silhouette(term.word, self.silhouette_mode),
                 the_comment,
             ],
             tags=tags,
         )
         self.add_note(note)
-        pass
+
+    def add_term(self, term: Term, tags=[]):
+        self._add_note(term, lookup(term.word), tts(term.word), tags)
+
+    def add_terms(self, terms: List[Term], tags=[]):
+        """
+        Add many terms at once, looking up their translations and audio
+        concurrently before building the notes.
+        """
+        words = [term.word for term in terms]
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            sounds = pool.submit(tts_many, words)
+            translations = dict(zip(words, pool.map(lookup, words)))
+            sounds = sounds.result()
+        for term in terms:
+            self._add_note(term, translations[term.word], sounds[term.word], tags)
 
 
 def add_model(col):
@@ -135,4 +163,5 @@ def add_model(col):
     return m
 
 
-anki.stdmodels.models.append((lambda: _(model_name), add_model))
+if anki is not None:
+    anki.stdmodels.models.append((lambda: _(model_name), add_model))
@@ -0,0 +1,261 @@
+import threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Fields filled in by the pipeline, in the order they are written back.
+FIELDS = ["Korean", "English", "Hanja", "Silhouette", "Sound"]
+
+MAX_WORKERS = 8
+
+# Maximum number of requests in flight against each network service.
+SERVICE_LIMITS = {"ndic": 4, "tts": 4}
+
+BATCH_SIZE = 50
+
+
+class SingleFlight(object):
+    """
+    Shares calls in flight: a call made while another one with the same key is
+    still running waits for it and gets its result, instead of running again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[object, Future] = {}
+
+    def do(self, key, fn: Callable, *args) -> Tuple[object, bool]:
+        """
+        Return `fn(*args)`, and whether it was shared with another call.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            shared = future is not None
+            if not shared:
+                future = self._calls[key] = Future()
+        if shared:
+            return future.result(), True
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result(), False
+
+
+# Shared by every pipeline, so that concurrent runs don't fetch the same word
+# twice.
+flights = SingleFlight()
+
+
+class Task(object):
+    """A note travelling through the pipeline."""
+
+    def __init__(self, key, note_dict: Dict[str, str]):
+        self.key = key
+        self.note_dict = note_dict
+        self.korean = ""
+        self.pending = 0
+
+    @property
+    def done(self) -> bool:
+        return self.pending == 0
+
+
+class FillPipeline(object):
+    """
+    Fills in missing fields for a stream of notes.
+
+    The local stages (cleanup, hanja, silhouette) run in batches on the calling
+    thread, with `hanja` looking up a whole batch of words at once, while the
+    network-bound stages (ndic, TTS) run on a bounded worker pool, with at most
+    `limits[service]` requests in flight per service. Notes are yielded back to
+    the caller, on the calling thread, as soon as all of their stages are done,
+    so that the caller can write them back.
+
+    Each word is looked up at most once per run, and its results fanned out to
+    every note that needs them. Requests still in flight are also shared with
+    other pipelines through `flights`. `lookups` counts the lookups made per
+    service, and `saved` the ones avoided.
+    """
+
+    def __init__(
+        self,
+        cleanup: Callable[[str], str],
+        lookup: Callable[[str], str],
+        hanja: Callable[[Iterable[str]], Dict[str, dict]],
+        silhouette: Callable[[str], str],
+        tts: Callable[[str], str],
+        max_workers: int = MAX_WORKERS,
+        limits: Optional[Dict[str, int]] = None,
+        batch_size: int = BATCH_SIZE,
+        flights: SingleFlight = flights,
+    ):
+        self.cleanup = cleanup
+        self.lookup = lookup
+        self.hanja = hanja
+        self.silhouette = silhouette
+        self.tts = tts
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.flights = flights
+        self.lookups = Counter()
+        self.saved = Counter()
+        self._stats_lock = threading.Lock()
+        limits = dict(SERVICE_LIMITS, **(limits or {}))
+        self._limits = {
+            service: threading.BoundedSemaphore(n) for service, n in limits.items()
+        }
+
+    def _is_missing(self, note_dict: Dict[str, str], field: str) -> bool:
+        return field in note_dict and self.cleanup(note_dict[field]) == ""
+
+    def _prepare(
+        self, task: Task, hanjas: Dict[str, dict]
+    ) -> List[Tuple[str, str, Callable[[str], str]]]:
+        """
+        Run the local stages for a note, and return the network jobs it still
+        needs as (service, field, function) tuples.
+        """
+        note_dict = task.note_dict
+        korean = task.korean
+        jobs = []
+
+        if self._is_missing(note_dict, "English") and korean != "":
+            note_dict["Korean"] = korean
+            jobs.append(("ndic", "English", self.lookup))
+
+        if self._is_missing(note_dict, "Hanja"):
+            found = hanjas.get(korean)
+            if found is not None:
+                note_dict["Hanja"] = found["hanja"]
+
+        if self._is_missing(note_dict, "Silhouette"):
+            note_dict["Silhouette"] = self.silhouette(korean)
+
+        if self._is_missing(note_dict, "Sound"):
+            jobs.append(("tts", "Sound", self.tts))
+
+        return jobs
+
+    def _limited(self, service: str, fn: Callable[[str], str], korean: str) -> str:
+        with self._limits[service]:
+            return fn(korean)
+
+    def _call(self, service: str, fn: Callable[[str], str], korean: str) -> str:
+        result, shared = self.flights.do(
+            (service, korean), self._limited, service, fn, korean
+        )
+        if shared:
+            self._count(self.lookups, service, -1)
+            self._count(self.saved, service)
+        return result
+
+    def _count(self, counter: Counter, service: str, n: int = 1):
+        with self._stats_lock:
+            counter[service] += n
+
+    def _hanjas(self, tasks: List[Task], known: Dict[str, Optional[dict]]):
+        """Look up the hanja of words not looked up yet into `known`."""
+        words = [t.korean for t in tasks if self._is_missing(t.note_dict, "Hanja")]
+        new = set(words) - known.keys()
+        found = self.hanja(new) if new else {}
+        for word in new:
+            known[word] = found.get(word)
+        self._count(self.lookups, "hanja", len(new))
+        self._count(self.saved, "hanja", len(words) - len(new))
+
+    @staticmethod
+    def _settle(task: Task, field: str, future: Future, on_error):
+        try:
+            task.note_dict[field] = future.result()
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(task.key, field, e)
+        task.pending -= 1
+
+    def run(
+        self,
+        items: Iterable[Tuple[object, Dict[str, str]]],
+        tick: Optional[Callable[[], None]] = None,
+        on_error: Optional[Callable[[object, str, Exception], None]] = None,
+    ) -> Iterator[Tuple[object, Dict[str, str]]]:
+        """
+        Process (key, note_dict) pairs and yield them back once filled in.
+        Notes without a Korean field are yielded back untouched. `tick` is
+        called periodically while waiting on the network, so that the caller
+        can keep its UI responsive.
+
+        When a network stage fails, the error is passed to `on_error` as
+        `on_error(key, field, error)`, before the note is yielded with that
+        field left as it was. Without `on_error`, the error is raised.
+        """
+        items = iter(items)
+        # Futures of the requests in flight, by (service, word), the notes
+        # waiting on each, and the futures of the requests already done.
+        in_flight: Dict[Future, Tuple[str, str]] = {}
+        waiting: Dict[Tuple[str, str], List[Tuple[Task, str]]] = {}
+        resolved: Dict[Tuple[str, str], Future] = {}
+        hanjas: Dict[str, Optional[dict]] = {}
+
+        def drain(max_pending):
+            while len(in_flight) > max_pending:
+                finished, _ = wait(
+                    list(in_flight), timeout=0.1, return_when=FIRST_COMPLETED
+                )
+                if not finished and tick is not None:
+                    tick()
+                for future in finished:
+                    flight = in_flight.pop(future)
+                    resolved[flight] = future
+                    for task, field in waiting.pop(flight):
+                        self._settle(task, field, future, on_error)
+                        if task.done:
+                            yield task.key, task.note_dict
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            try:
+                while True:
+                    batch = list(islice(items, self.batch_size))
+                    if not batch:
+                        break
+                    tasks = []
+                    for key, note_dict in batch:
+                        task = Task(key, note_dict)
+                        if "Korean" not in note_dict:
+                            yield task.key, task.note_dict
+                            continue
+                        task.korean = self.cleanup(note_dict["Korean"])
+                        tasks.append(task)
+                    self._hanjas(tasks, hanjas)
+                    for task in tasks:
+                        jobs = self._prepare(task, hanjas)
+                        task.pending = len(jobs)
+                        for service, field, fn in jobs:
+                            flight = (service, task.korean)
+                            if flight in resolved:
+                                self._count(self.saved, service)
+                                self._settle(task, field, resolved[flight], on_error)
+                            elif flight in waiting:
+                                self._count(self.saved, service)
+                                waiting[flight].append((task, field))
+                            else:
+                                self._count(self.lookups, service)
+                                future = pool.submit(
+                                    self._call, service, fn, task.korean
+                                )
+                                in_flight[future] = flight
+                                waiting[flight] = [(task, field)]
+                        if task.done:
+                            yield task.key, task.note_dict
+                    # Keep up to a batch worth of requests in flight while the
+                    # next batch goes through the local stages.
+                    yield from drain(self.batch_size)
+                yield from drain(0)
+            finally:
+                for future in in_flight:
+                    future.cancel()
@@ -1,25 +1,42 @@
 import csv
+import hashlib
+import multiprocessing
 import os
+import unicodedata
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import Optional, Collection, Set
+from typing import Optional, Dict, Iterator, List, Set, Tuple
 import re
 
-from konlpy.tag import Okt
+from .cache import Cache, MISSING, USER_FILES_DIR
+from .instrumentation import metrics
+from .lazy import Lazy
 
-okt = Okt()
-okt.pos("질문이나 건의사항은", norm=True, stem=True)  # warm up
+DIFFICULTY_LEVELS = {"A": 0, "B": 1, "C": 2}
 
-_VOCAB = []
+# Roughly how many characters to tokenize between two updates of the word set.
+CHUNK_SIZE = 2000
+
+# How many sentences to send to a worker process at once.
+SHARD_SIZE = 8
+
+# Parts of speech worth studying.
+CONTENT_TYPES = {"Noun", "Adjective", "Verb"}
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?。…])\s+|\n+")
 
 ROOT_DIR = Path(os.path.dirname(os.path.abspath(__file__)))
 
 path = (ROOT_DIR / "vocab.csv").resolve()
 
-if not path.exists():
-    raise Exception(f"Can't find vocab file: {path}")
-
 
 class Term(object):
+    __slots__ = ["rank", "word", "hanja", "notes", "difficulty", "ambiguous"]
+
     def __init__(self, rank: str, word: str, notes: str, difficulty: str):
         self.rank = None if rank == "" else int(rank)
         self.word = re.sub("[0-9]+", "", word)
@@ -30,54 +47,385 @@ class Term(object):
         self.difficulty = difficulty
         self.ambiguous = True if re.search("[0-9]+", word) is not None else False
 
+    @classmethod
+    def from_fields(
+        cls,
+        rank: Optional[int],
+        word: str,
+        hanja: Optional[str],
+        notes: Optional[str],
+        difficulty: str,
+        ambiguous: bool,
+    ) -> "Term":
+        """Build a term from already parsed fields."""
+        term = cls.__new__(cls)
+        term.rank = rank
+        term.word = word
+        term.hanja = hanja
+        term.notes = notes
+        term.difficulty = difficulty
+        term.ambiguous = ambiguous
+        return term
+
     def __repr__(self):
         return (
             f"{self.word} ({self.difficulty}, {self.rank}, {self.hanja}, {self.notes})"
         )
 
 
+class Vocab(object):
+    """
+    The vocab sorted by rank, indexed by word.
+    """
+
+    def __init__(self, terms: List[Term]):
+        self.terms = terms
+        # Maps each word to the positions of its terms in `terms`, in rank order.
+        self.index: Dict[str, List[int]] = {}
+        for position, term in enumerate(terms):
+            self.index.setdefault(term.word, []).append(position)
+        # Difficulty level of the term at each position in `terms`.
+        self.levels = [_level(term.difficulty) for term in terms]
+
+
 def search(word: str, max_vocab: int = 3500) -> Optional[Term]:
-    return next((term for term in _VOCAB[:max_vocab] if term.word == word), None)
+    vocab = _vocab.get()
+    positions = vocab.index.get(word)
+    if positions and positions[0] < max_vocab:
+        return vocab.terms[positions[0]]
+    return None
 
 
-def extract_words(text: str) -> Set[str]:
-    tokens = okt.pos(text, norm=True, stem=True)
-    return set(
-        [
-            word
-            for (word, type) in tokens
-            if type == "Noun" or type == "Adjective" or type == "Verb"
-        ]
-    )
+def _content_words(tokens) -> Iterator[str]:
+    return (word for (word, type) in tokens if type in CONTENT_TYPES)
 
 
-def at_least_difficulty(min_difficulty: str, term: Term) -> bool:
-    if min_difficulty == "C":
-        return term.difficulty == "C"
-    elif min_difficulty == "B":
-        return term.difficulty == "B" or term.difficulty == "C"
+def split_sentences(text: str) -> Iterator[str]:
+    start = 0
+    for boundary in SENTENCE_BOUNDARY.finditer(text):
+        end = boundary.start()
+        if end > start:
+            yield text[start:end]
+        start = boundary.end()
+    if start < len(text):
+        yield text[start:]
+
+
+def _sentence_batches(text: str, chunk_size: int) -> Iterator[List[str]]:
+    batch = []
+    size = 0
+    for sentence in split_sentences(text):
+        if batch and size + len(sentence) > chunk_size:
+            yield batch
+            batch = []
+            size = 0
+        batch.append(sentence)
+        size += len(sentence) + 1
+    if batch:
+        yield batch
+
+
+def chunks(text: str, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Group the sentences of `text` into chunks of about `chunk_size` characters.
+    """
+    for batch in _sentence_batches(text, chunk_size):
+        yield " ".join(batch)
+
+
+def _sentence_key(sentence: str) -> str:
+    normalized = " ".join(unicodedata.normalize("NFC", sentence).split())
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _encode_tokens(tokens: List[Tuple[str, str]]) -> bytes:
+    packed = "\x1e".join(f"{word}\x1f{pos}" for word, pos in tokens)
+    return zlib.compress(packed.encode("utf-8"))
+
+
+def _decode_tokens(data: bytes) -> List[Tuple[str, str]]:
+    packed = zlib.decompress(data).decode("utf-8")
+    return [tuple(token.split("\x1f")) for token in packed.split("\x1e") if token]
+
+
+def _okt_pos(sentence: str) -> List[Tuple[str, str]]:
+    return okt.get().pos(sentence, norm=True, stem=True)
+
+
+def _warm_up_worker():
+    okt.get()
+
+
+def process_pool(processes: int) -> Optional[ProcessPoolExecutor]:
+    """
+    A pool of `processes` worker processes, each with its own warmed up Okt, or
+    None if worker processes can't be started here, like inside Anki.
+    """
+    try:
+        pool = ProcessPoolExecutor(
+            max_workers=processes,
+            # Forking a process that runs a JVM isn't safe.
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_up_worker,
+        )
+        pool.submit(_warm_up_worker).result()
+        return pool
+    except Exception as e:
+        print(f"jjigae: tokenizing in-process, can't start worker processes: {e}")
+        return None
+
+
+def _tokenize_misses(
+    sentences: List[str], pool: Optional[ProcessPoolExecutor]
+) -> List[List[Tuple[str, str]]]:
+    if pool is not None and len(sentences) > 1:
+        try:
+            return list(pool.map(_okt_pos, sentences, chunksize=SHARD_SIZE))
+        except BrokenProcessPool as e:
+            print(f"jjigae: tokenizing in-process, worker processes died: {e}")
+    return [_okt_pos(sentence) for sentence in sentences]
+
+
+def tokenize_many(
+    sentences: List[str], pool: Optional[ProcessPoolExecutor] = None
+) -> List[List[Tuple[str, str]]]:
+    """
+    The (word, part of speech) tokens of each sentence, from the on-disk cache
+    if we've seen the same sentence before, or from Okt otherwise. Sentences
+    that aren't cached are sharded across `pool`, if given.
+    """
+    keys = [_sentence_key(sentence) for sentence in sentences]
+    tokens = token_cache.get_many(keys)
+    misses = [i for i, cached in enumerate(tokens) if cached is MISSING]
+    for i, cached in enumerate(tokens):
+        if cached is not MISSING:
+            tokens[i] = _decode_tokens(cached)
+
+    if misses:
+        with metrics.timer("tokenize"):
+            fresh = _tokenize_misses([sentences[i] for i in misses], pool)
     else:
-        return True
+        fresh = []
+
+    for i, sentence_tokens in zip(misses, fresh):
+        tokens[i] = sentence_tokens
+    token_cache.set_many((keys[i], _encode_tokens(tokens[i])) for i in misses)
+    return tokens
+
+
+def tokenize(sentence: str) -> List[Tuple[str, str]]:
+    return tokenize_many([sentence])[0]
+
+
+def _iter_count_words(
+    text: str, chunk_size: int, processes: Optional[int]
+) -> Iterator[Counter]:
+    pool = process_pool(processes) if processes and processes > 1 else None
+    if pool is not None:
+        # Give every worker a fair share of each chunk.
+        chunk_size *= processes
+    counts = Counter()
+    try:
+        for batch in _sentence_batches(text, chunk_size):
+            for tokens in tokenize_many(batch, pool):
+                counts.update(_content_words(tokens))
+            yield counts
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def iter_count_words(
+    text: str,
+    chunk_size: int = CHUNK_SIZE,
+    processes: Optional[int] = None,
+) -> Iterator[Counter]:
+    """
+    Tokenize `text` a chunk of sentences at a time, yielding how many times
+    each word was found so far after every chunk. Only sentences that aren't in
+    the token cache go through Okt. The same counter is yielded every time,
+    growing.
+
+    Only one chunk is held in memory at once, however long the text. With
+    more than one of `processes`, sentences are sharded across that many worker
+    processes, falling back to tokenizing in-process if they can't be started.
+    """
+    return _iter_count_words(text, chunk_size, processes)
+
+
+def iter_extract_words(
+    text: str,
+    chunk_size: int = CHUNK_SIZE,
+    processes: Optional[int] = None,
+) -> Iterator[Set[str]]:
+    """
+    Like `iter_count_words`, yielding the set of words found so far instead.
+    """
+    words = set()
+    for counts in iter_count_words(text, chunk_size, processes):
+        words.update(counts)
+        yield words
+
+
+def count_words(text: str, processes: Optional[int] = None) -> Counter:
+    counts = Counter()
+    for counts in iter_count_words(text, processes=processes):
+        pass
+    return counts
+
+
+def extract_words(text: str, processes: Optional[int] = None) -> Set[str]:
+    return set(count_words(text, processes))
+
+
+def _level(difficulty: str) -> int:
+    return DIFFICULTY_LEVELS.get(difficulty, -1)
+
+
+def _min_level(min_difficulty: str) -> int:
+    # Anything below "B" means no minimum at all, so even terms of unknown
+    # difficulty pass.
+    return _level(min_difficulty) if min_difficulty in ("B", "C") else -1
+
+
+def at_least_difficulty(min_difficulty: str, term: Term) -> bool:
+    return _level(term.difficulty) >= _min_level(min_difficulty)
+
+
+def _positions(words: Set[str], max_vocab: int, min_difficulty: str) -> List[int]:
+    vocab = _vocab.get()
+    min_level = _min_level(min_difficulty)
+    positions = []
+    for word in words:
+        for position in vocab.index.get(word, ()):
+            if position >= max_vocab:
+                break
+            if vocab.levels[position] >= min_level:
+                positions.append(position)
+    return positions
 
 
 def extract(text: str, max_vocab: int = 3500, min_difficulty: str = "A") -> Set[Term]:
+    terms = _vocab.get().terms
     words = extract_words(text)
-    return {
-        term
-        for term in _VOCAB[:max_vocab]
-        if term.word in words and at_least_difficulty(min_difficulty, term)
-    }
+    return {terms[p] for p in _positions(words, max_vocab, min_difficulty)}
+
+
+def rank_words(words: Set[str], min_difficulty: str = "A") -> List[Tuple[int, Term]]:
+    """
+    The terms for `words` over the whole vocab, as (position in the vocab, term)
+    pairs in vocab order, so that any `max_vocab` cutoff is a prefix of the result.
+    """
+    terms = _vocab.get().terms
+    positions = sorted(_positions(words, len(terms), min_difficulty))
+    return [(p, terms[p]) for p in positions]
 
 
-def _load_vocab() -> Collection[Term]:
+def extract_ranked(text: str, min_difficulty: str = "A") -> List[Tuple[int, Term]]:
+    """
+    Like `extract` over the whole vocab, ranked as in `rank_words`.
+    """
+    return rank_words(extract_words(text), min_difficulty)
+
+
+class Coverage(object):
+    """
+    How much of a text is understood once its words are learned, learning the
+    most frequent words first.
+
+    `counts` are the words of the text, as from `count_words`, and `ranked` the
+    terms to learn, as from `rank_words`. Words of the vocab that aren't in
+    `ranked` (easier than the minimum difficulty) and `known` words count as
+    understood from the start.
+    """
+
+    def __init__(
+        self,
+        counts: Counter,
+        ranked: List[Tuple[int, Term]],
+        known: Set[str] = frozenset(),
+    ):
+        index = _vocab.get().index
+        total = sum(counts.values())
+        # Terms of the same word are learned together, in vocab order.
+        first = {}
+        for position, term in ranked:
+            first.setdefault(term.word, position)
+        self.baseline = _share(
+            sum(
+                n
+                for word, n in counts.items()
+                if word not in first and (word in index or word in known)
+            ),
+            total,
+        )
+        ranked = sorted(
+            ranked, key=lambda pt: (-counts[pt[1].word], first[pt[1].word], pt[0])
+        )
+        self.terms = [term for _, term in ranked]
+        # Share of the text understood once each term, and every term before
+        # it, is learned.
+        self.covered = []
+        covered = self.baseline * total
+        learned = set()
+        for term in self.terms:
+            if term.word not in learned:
+                learned.add(term.word)
+                covered += counts[term.word]
+            self.covered.append(_share(covered, total))
+
+    def study_count(self, target: float) -> int:
+        """
+        The number of terms to learn, from the start of `terms`, to understand
+        at least `target` of the text, or all of them if that isn't enough.
+        """
+        if target <= self.baseline:
+            return 0
+        i = bisect_left(self.covered, target)
+        if i == len(self.covered):
+            return i
+        # Don't leave out the other terms of the last word.
+        return bisect_right(self.covered, self.covered[i])
+
+
+def _share(n: float, total: int) -> float:
+    return n / total if total else 1.0
+
+
+def _load_okt():
+    from konlpy.tag import Okt
+
+    okt = Okt()
+    okt.pos("질문이나 건의사항은", norm=True, stem=True)  # warm up
+    return okt
+
+
+def _load_csv() -> List[Term]:
+    if not path.exists():
+        raise Exception(f"Can't find vocab file: {path}")
+
     with open(path) as file:
         reader = csv.reader(file)
         vocab = []
-        for (rank, word, kind, notes, difficulty) in list(reader)[1:]:
+        for rank, word, kind, notes, difficulty in list(reader)[1:]:
             t = Term(rank=rank, word=word, notes=notes, difficulty=difficulty)
             vocab.append(t)
         vocab.sort(key=lambda term: term.rank or 7000)
         return vocab
 
 
-_VOCAB = _load_vocab()
+def _load_vocab() -> List[Term]:
+    from . import vocab_store
+
+    try:
+        return vocab_store.load()
+    except (OSError, ValueError):
+        return _load_csv()
+
+
+# Tokens of every sentence we've seen, by hash of the normalized sentence.
+token_cache = Cache(USER_FILES_DIR / "tokens.sqlite", max_entries=200000)
+
+# Loaded on first use, so that importing the add-on stays cheap.
+okt = Lazy("okt", _load_okt)
+_vocab = Lazy("vocab", lambda: Vocab(_load_vocab()))
@@ -0,0 +1,121 @@
+import re
+from functools import lru_cache
+from typing import Iterable, List
+
+# Tags, non-breaking spaces and cloze deletions, matched in a single scan.
+_MARKUP = re.compile(r"(?s:<.*?>)|&nbsp;|\{\{c[0-9]+::(.*?)(?:::.*?)?\}\}")
+
+# How many distinct field values to remember. Notes of a deck share a lot of
+# them, and "Fill missing" cleans the same fields several times per note.
+MEMO_SIZE = 8192
+
+
+def _replace(match) -> str:
+    cloze = match.group(1)
+    if cloze is not None:
+        # The answer of a cloze can itself contain markup.
+        return _MARKUP.sub(_replace, cloze)
+    return " " if match.group(0) == "&nbsp;" else ""
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def cleanup(txt) -> str:
+    """Remove all HTML, tags, and others."""
+    if not txt:
+        return ""
+    return _MARKUP.sub(_replace, txt).strip()
+
+
+def cleanup_many(fields: Iterable[str]) -> List[str]:
+    return [cleanup(field) for field in fields]
+
+
+# Hangul syllables are laid out as initial * 588 + medial * 28 + final.
+SYLLABLE_BASE = 0xAC00
+LAST_SYLLABLE = 0xD7A3
+MEDIALS = 21
+FINALS = 28
+
+CHOSEONG = "ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ"
+
+# Conjoining jamo, syllables and compatibility jamo.
+_HANGUL = frozenset(
+    chr(code)
+    for start, end in [(0x1100, 0x11FF), (0xAC00, 0xD7AF), (0x3130, 0x318F)]
+    for code in range(start, end + 1)
+)
+
+SILHOUETTE_MODES = ["underscores", "syllables", "jamo", "choseong"]
+
+
+def silhouette_mode(config: dict) -> str:
+    """
+    The silhouette mode set in the add-on config, or the default one if it
+    isn't set or isn't one of `SILHOUETTE_MODES`.
+    """
+    mode = config.get("silhouette", SILHOUETTE_MODES[0])
+    if mode not in SILHOUETTE_MODES:
+        print(f"jjigae: unknown silhouette mode {mode!r}, using {SILHOUETTE_MODES[0]}")
+        return SILHOUETTE_MODES[0]
+    return mode
+
+
+def _jamo_count(c: str) -> str:
+    code = ord(c) - SYLLABLE_BASE
+    if not 0 <= code <= LAST_SYLLABLE - SYLLABLE_BASE:
+        return "1"
+    return "3" if code % FINALS else "2"
+
+
+def _choseong(c: str) -> str:
+    code = ord(c) - SYLLABLE_BASE
+    if not 0 <= code <= LAST_SYLLABLE - SYLLABLE_BASE:
+        return c
+    return CHOSEONG[code // (MEDIALS * FINALS)]
+
+
+# How each Hangul character is rendered, and what goes between two of them.
+_GLYPHS = {
+    "underscores": (lambda c: "_", " "),
+    "jamo": (_jamo_count, " "),
+    "choseong": (_choseong, ""),
+}
+
+
+def silhouette(hangul: str, mode: str = "underscores") -> str:
+    """
+    Hide the Hangul in `hangul`, keeping everything else. Depending on `mode`,
+    every syllable becomes an underscore, the number of jamo it's made of, or
+    its initial consonant, or every word becomes its number of syllables:
+
+        silhouette("사과 주스")                -> "_ _ _ _"
+        silhouette("사과 주스", "syllables")   -> "2 2"
+        silhouette("사과 주스", "jamo")        -> "2 2 2 2"
+        silhouette("사과 주스", "choseong")    -> "ㅅㄱ ㅈㅅ"
+    """
+    out = []
+    run = 0
+    if mode == "syllables":
+        for c in hangul:
+            if c in _HANGUL:
+                run += 1
+                continue
+            if run:
+                out.append(str(run))
+                run = 0
+            out.append(c)
+        if run:
+            out.append(str(run))
+        return "".join(out)
+
+    glyph, separator = _GLYPHS[mode]
+    for c in hangul:
+        if c in _HANGUL:
+            if run:
+                out.append(separator)
+            out.append(glyph(c))
+            run += 1
+        else:
+            out.append(c)
+            run = 0
+    return "".join(out)
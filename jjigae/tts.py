@@ -9,37 +9,143 @@
 
 
 import os
+import random
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable
 
 import gtts
 
-from aqt import mw
+MAX_WORKERS = 4
+
+# Where to save audio when running outside of Anki, see `media_dir`.
+MEDIA_DIR = None
+
+# Base delay, in seconds, between download attempts. It doubles on every retry.
+BACKOFF = 0.5
+
+
+class MediaManifest(object):
+    """
+    The names of the files in a media folder, read with a single directory scan
+    and kept up to date as we download new files into it. Files are checked to
+    be non-empty only when looked up, once each.
+    """
+
+    def __init__(self, media_dir: str):
+        self.media_dir = media_dir
+        self._lock = threading.Lock()
+        with os.scandir(media_dir) as entries:
+            self._names = {entry.name for entry in entries if entry.is_file()}
+        # Whether each file looked up so far is non-empty.
+        self._non_empty: Dict[str, bool] = {}
+
+    def __contains__(self, filename: str) -> bool:
+        if filename not in self._names:
+            return False
+        non_empty = self._non_empty.get(filename)
+        if non_empty is None:
+            try:
+                non_empty = os.stat(os.path.join(self.media_dir, filename)).st_size > 0
+            except OSError:
+                non_empty = False
+            with self._lock:
+                self._non_empty[filename] = non_empty
+        return non_empty
+
+    def add(self, filename: str):
+        with self._lock:
+            self._names.add(filename)
+            self._non_empty[filename] = True
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def media_dir() -> str:
+    """
+    The current profile's media folder, or `MEDIA_DIR` when it's set.
+    """
+    if MEDIA_DIR is not None:
+        return MEDIA_DIR
+    from aqt import mw
+
+    return mw.col.media.dir()
+
+
+def manifest() -> MediaManifest:
+    """
+    The manifest of the media folder we save audio to.
+    """
+    global _manifest
+    directory = media_dir()
+    with _manifest_lock:
+        if _manifest is None or _manifest.media_dir != directory:
+            _manifest = MediaManifest(directory)
+        return _manifest
+
+
+def refresh_manifest():
+    """
+    Scan the media folder again on next use, for files saved or deleted since.
+    Called at the start of every run that downloads audio.
+    """
+    global _manifest
+    with _manifest_lock:
+        _manifest = None
 
 
 def get_word_from_google(source, lang="ko", attempts=3):
     gTTS = gtts.tts.gTTS
     filename, path = getFilename("_".join([source, "G", lang]), ".mp3")
+    media = manifest()
 
-    if os.path.exists(path) and os.stat(path).st_size > 0:
+    if filename in media:
         return filename
 
     for attempt in range(attempts):
+        if attempt > 0:
+            # Exponential backoff, with full jitter.
+            time.sleep(random.uniform(0, BACKOFF * 2 ** attempt))
+        # Download to a temporary file first, so that an interrupted
+        # download never leaves an empty file behind.
+        tmp_path = f"{path}.{threading.get_ident()}.part"
         try:
-            tts = gTTS(source, lang=lang)
-            tts.save(path)
-            break
+            gTTS(source, lang=lang).save(tmp_path)
+            if os.stat(tmp_path).st_size == 0:
+                raise RuntimeError(f"Got no audio for {source}")
+            os.replace(tmp_path, path)
+            media.add(filename)
+            return filename
         except Exception as e:
             error = str(e)
-            tts = None
-    if tts is not None:
-        return filename
-    else:
-        raise RuntimeError(error)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    raise RuntimeError(error)
+
+
+def get_words_from_google(
+    sources: Iterable[str], lang="ko", attempts=3, max_workers=MAX_WORKERS
+) -> Dict[str, str]:
+    """
+    Fetch audio for many words at once, with at most `max_workers` downloads
+    in flight. Returns a map from word to filename.
+    """
+    unique = list(dict.fromkeys(sources))
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        filenames = pool.map(
+            lambda source: get_word_from_google(source, lang, attempts), unique
+        )
+        return dict(zip(unique, filenames))
 
 
 def getFilename(base, ext):
     filename = stripInvalidChars(base) + ext
-    path = os.path.join(mw.col.media.dir(), filename)
+    path = os.path.join(media_dir(), filename)
     return (filename, path)
 
 
@@ -1,11 +1,18 @@
 from aqt import mw
 
-from typing import List, Set, Optional
+from bisect import bisect_left
+from collections import Counter
+from typing import List, Set, Optional, Tuple
 
 import genanki
+from anki.utils import splitFields
 
-from .prestudy import extract, Term
-from .models import Deck
+from . import lazy, prestudy
+from .prestudy import Coverage, iter_count_words, rank_words, token_cache, Term
+from .instrumentation import cache_stats, metrics, write_report
+from .models import ChineseDeck
+from .text import silhouette_mode
+from .tts import refresh_manifest
 
 from cached_property import cached_property
 
@@ -29,6 +36,67 @@ import logging
 
 RECOMMENDED_TARGET_VOCAB_SIZE = 3500
 
+# Share of the text to understand by default, when targeting reading coverage.
+DEFAULT_TARGET_COVERAGE = 95
+
+# How long to wait after the last keystroke before updating the words table.
+UPDATE_DELAY_MS = 300
+
+# Card queue and type values, as stored in the collection.
+QUEUE_SUSPENDED = -1
+CARD_TYPE_NEW = 0
+
+# (collection path, modification time, words), for the last collection we read.
+_studied_cache = None
+
+
+def words_already_studied(col) -> Set[str]:
+    """
+    Korean words from notes that are being studied (some card isn't new), or
+    that are deliberately left out (all cards suspended).
+
+    Reads the notes and the state of their cards in a single query, and caches
+    the result until the collection is modified.
+    """
+    global _studied_cache
+    unsaved = getattr(col.db, "mod", False)
+    if not unsaved and _studied_cache and _studied_cache[:2] == (col.path, col.mod):
+        return _studied_cache[2]
+
+    korean_field = {}
+    for model in col.models.all():
+        names = [f["name"] for f in model["flds"]]
+        if "Korean" in names:
+            korean_field[model["id"]] = names.index("Korean")
+
+    suspended, not_suspended, not_new = set(), set(), set()
+    if korean_field:
+        mids = ", ".join(str(mid) for mid in korean_field)
+        rows = col.db.execute(
+            f"""
+            SELECT n.mid, n.flds,
+                max(c.queue = {QUEUE_SUSPENDED}),
+                max(c.queue != {QUEUE_SUSPENDED}),
+                max(c.type != {CARD_TYPE_NEW})
+            FROM cards c JOIN notes n ON n.id = c.nid
+            WHERE n.mid IN ({mids})
+            GROUP BY n.id
+            """
+        )
+        for mid, flds, any_suspended, any_not_suspended, any_not_new in rows:
+            word = splitFields(flds)[korean_field[mid]]
+            if any_suspended:
+                suspended.add(word)
+            if any_not_suspended:
+                not_suspended.add(word)
+            if any_not_new:
+                not_new.add(word)
+
+    words = not_new | (suspended - not_suspended)
+    if not unsaved:
+        _studied_cache = (col.path, col.mod, words)
+    return words
+
 
 class LineEditWithFocusedSignal(QLineEdit):
     focused = pyqtSignal()
@@ -40,6 +108,8 @@ class LineEditWithFocusedSignal(QLineEdit):
 class PrestudyDialog:
     @classmethod
     def instantiate_and_run(cls):
+        # Start the tokenizer while the user pastes in their text.
+        lazy.warm_up([prestudy._vocab, prestudy.okt])
         cls().show_text_entry_window()
 
     def show_text_entry_window(self):
@@ -74,13 +144,62 @@ class PrestudyDialog:
 
         self.show_words_window()
 
-    @cached_property
-    def input_words(self) -> Set[str]:
+    def start_extraction(self):
         """
-        Return the input after segmenting into words.
+        Tokenize the input a chunk at a time from the event loop, so that the
+        words table fills in progressively, even for very long texts.
+
+        `candidates` holds the words found so far that aren't already studied,
+        as (position in the vocab, term) pairs in vocab order. Changing the vocab
+        target just moves a cutoff over this list. `word_counts` counts every
+        word of the text, for targeting reading coverage instead.
         """
-        return list(
-            extract(self.input_text, min_difficulty="B", max_vocab=self.word_target)
+        self.candidates: List[Tuple[int, Term]] = []
+        self.candidate_positions: List[int] = []
+        self.seen_words: Set[str] = set()
+        self.word_counts = Counter()
+        self.coverage: Optional[Coverage] = None
+        self.word_stream = iter_count_words(self.input_text)
+        metrics.reset()
+        token_cache.reset_stats()
+
+        self.extract_timer = QtCore.QTimer(self.words_window)
+        self.extract_timer.timeout.connect(lambda: self.extract_next_chunk())
+        self.extract_timer.start(0)
+
+    def extract_next_chunk(self):
+        try:
+            self.word_counts = next(self.word_stream)
+        except StopIteration:
+            self.extract_timer.stop()
+            self.write_report()
+            return
+
+        # Word counts have changed, so has the coverage of every word.
+        self.coverage = None
+        new_words = self.word_counts.keys() - self.seen_words
+        self.seen_words |= new_words
+        new_words -= self.words_already_studied
+
+        for position, term in rank_words(new_words, min_difficulty="B"):
+            i = bisect_left(self.candidate_positions, position)
+            self.candidate_positions.insert(i, position)
+            self.candidates.insert(i, (position, term))
+            # Rows from here on have moved down.
+            self.shown_words = min(self.shown_words, i)
+        self.update_words_table()
+
+    def write_report(self):
+        write_report(
+            "prestudy",
+            dict(
+                kind="prestudy",
+                characters=len(self.input_text),
+                words=len(self.word_counts),
+                candidates=len(self.candidates),
+                caches=dict(tokens=cache_stats(token_cache.hits, token_cache.misses)),
+                **metrics.report(),
+            ),
         )
 
     def show_words_window(self):
@@ -97,6 +216,8 @@ class PrestudyDialog:
         )
         self.vocab_custom_radio = QRadioButton("Custom: ")
         self.vocab_custom_box = LineEditWithFocusedSignal()
+        self.coverage_radio = QRadioButton("Reading coverage (%): ")
+        self.coverage_box = LineEditWithFocusedSignal(str(DEFAULT_TARGET_COVERAGE))
 
         radio_hbox = QHBoxLayout()
         radio_hbox.addStretch(1)
@@ -104,6 +225,9 @@ class PrestudyDialog:
         radio_hbox.addStretch(2)
         radio_hbox.addWidget(self.vocab_custom_radio)
         radio_hbox.addWidget(self.vocab_custom_box)
+        radio_hbox.addStretch(2)
+        radio_hbox.addWidget(self.coverage_radio)
+        radio_hbox.addWidget(self.coverage_box)
         radio_hbox.addStretch(1)
         vbox.addLayout(radio_hbox)
 
@@ -111,6 +235,8 @@ class PrestudyDialog:
 
         self.words_table = self.init_words_table()
         vbox.addWidget(self.words_table)
+        self.coverage_label = QLabel()
+        vbox.addWidget(self.coverage_label)
 
         continue_hbox = QHBoxLayout()
         continue_hbox.addStretch(1)
@@ -120,27 +246,77 @@ class PrestudyDialog:
 
         self.words_window.setLayout(vbox)
 
+        self.shown_words = 0
+        self.start_extraction()
         self.update_words_table()
 
+        # Wait for the user to stop typing before updating the table.
+        self.update_timer = QtCore.QTimer(self.words_window)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(UPDATE_DELAY_MS)
+        self.update_timer.timeout.connect(lambda: self.update_words_table())
+
         # TODO: for some reason, this disables the blinking cursor in `vocab_custom_box`
         self.vocab_custom_box.focused.connect(lambda: self.vocab_custom_radio.click())
         self.vocab_recommended_radio.clicked.connect(lambda: self.update_words_table())
         self.vocab_custom_radio.clicked.connect(lambda: self.update_words_table())
-        self.vocab_custom_box.textChanged.connect(lambda: self.update_words_table())
+        self.vocab_custom_box.textChanged.connect(lambda: self.update_timer.start())
+        self.coverage_box.focused.connect(lambda: self.coverage_radio.click())
+        self.coverage_radio.clicked.connect(lambda: self.update_words_table())
+        self.coverage_box.textChanged.connect(lambda: self.update_timer.start())
         continue_button.clicked.connect(lambda: self.words_window_continue_action())
 
         self.words_window.show()
 
     def update_words_table(self):
-        words_to_study = self.words_to_study
-        self.words_table.setRowCount(len(words_to_study))
-        for i, term in enumerate(self.words_to_study):
-            self.words_table.setItem(i, 0, QTableWidgetItem(term.word))
+        """
+        Show the words to study for the current target. For a vocab target they
+        always are a prefix of `candidates`, so only the rows past the previous
+        cutoff need filling. For a coverage target, their order changes with the
+        word counts, so all of the rows are filled.
+        """
+        terms = self.words_to_study
+        targets_coverage = self.coverage_radio.isChecked()
+        start = 0 if targets_coverage else self.shown_words
+        self.words_table.setRowCount(len(terms))
+        for i in range(start, len(terms)):
+            self.words_table.setItem(i, 0, QTableWidgetItem(terms[i].word))
+        self.shown_words = 0 if targets_coverage else len(terms)
+
+        if targets_coverage:
+            coverage = self.word_coverage
+            covered = coverage.covered[len(terms) - 1] if terms else coverage.baseline
+            self.coverage_label.setText(
+                f"{len(terms)} words to study, to understand {covered:.0%} of the text."
+            )
+        else:
+            self.coverage_label.setText("")
+
+    @property
+    def study_count(self) -> int:
+        return bisect_left(self.candidate_positions, self.word_target)
+
+    @property
+    def word_coverage(self) -> Coverage:
+        if self.coverage is None:
+            self.coverage = Coverage(
+                self.word_counts, self.candidates, self.words_already_studied
+            )
+        return self.coverage
 
     @property
     def words_to_study(self) -> List[Term]:
-        print(f"UNKNOWN: {self.unknown_words}")
-        return sorted(self.unknown_words, key=lambda w: w.rank)
+        if self.coverage_radio.isChecked():
+            coverage = self.word_coverage
+            return coverage.terms[: coverage.study_count(self.coverage_target)]
+        return [term for _, term in self.candidates[: self.study_count]]
+
+    @property
+    def coverage_target(self) -> float:
+        try:
+            return float(self.coverage_box.text()) / 100
+        except ValueError:
+            return 0
 
     @property
     def word_target(self):
@@ -153,30 +329,9 @@ class PrestudyDialog:
                 return 0
         return 0
 
-    @cached_property
-    def unknown_words(self) -> List[str]:
-        """
-        Get words in the text that aren't already studied.
-        """
-        return [
-            word for word in self.input_words if word not in self.words_already_studied
-        ]
-
     @cached_property
     def words_already_studied(self) -> Set[str]:
-        def words_for_query(query):
-            notes = [mw.col.getNote(id_) for id_ in mw.col.findNotes(query)]
-            rv = set()
-            for note in notes:
-                if "Korean" in note:
-                    rv.add(note["Korean"])
-            return rv
-
-        suspended = words_for_query("is:suspended")
-        not_suspended = words_for_query("-is:suspended")
-        not_new = words_for_query("-is:new")
-
-        return not_new | (suspended - not_suspended)
+        return words_already_studied(mw.col)
 
     def init_words_table(self, parent=None):
         """
@@ -187,6 +342,10 @@ class PrestudyDialog:
         return QTableWidget(0, 1, parent)
 
     def words_window_continue_action(self):
+        # Don't leave out words from the rest of the text.
+        while self.extract_timer.isActive():
+            self.extract_next_chunk()
+
         final_touches_window = FinalTouchesWindow(self.words_to_study)
 
         self.words_window.close()
@@ -257,10 +416,10 @@ def add_notes(vocab_words: List[Term], deck_name: str, tags: List[str]):
 
     # By using the same ID and name as the existing deck, the notes are added to the existing deck, rather than going
     # into a new deck or the default deck.
-    out_deck = Deck(deck["id"], deck_name)
-
-    for vocab_word in vocab_words:
-        out_deck.add_term(vocab_word, tags=tags)
+    config = mw.addonManager.getConfig(__name__) or {}
+    out_deck = ChineseDeck(deck["id"], deck_name, silhouette_mode(config))
+    refresh_manifest()
+    out_deck.add_terms(vocab_words, tags=tags)
 
     # Write the data to the collection
     out_deck.write_to_collection_from_addon()
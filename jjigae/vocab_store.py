@@ -0,0 +1,113 @@
+"""
+A compiled copy of vocab.csv, so that loading the vocab doesn't parse the CSV.
+
+    python -m jjigae.vocab_store
+
+The file is a header, the ranks, ambiguity flags and string lengths of each
+term as fixed-size arrays, and then all of the strings as one UTF-8 blob.
+Terms are stored in rank order, as `Vocab` expects them. A hash of the CSV it
+was compiled from is kept in the header, so that a stale copy is ignored.
+"""
+
+import hashlib
+import mmap
+import struct
+import sys
+from array import array
+from itertools import accumulate
+from pathlib import Path
+from typing import List
+
+from .prestudy import Term, path as csv_path
+
+MAGIC = b"JJVOCAB2"
+
+HEADER = struct.Struct("<8sII16s")
+
+# Strings kept for each term, in order.
+STRINGS = ["word", "hanja", "notes", "difficulty"]
+
+NO_RANK = -1
+
+path = csv_path.with_suffix(".bin")
+
+
+def _array(typecode: str, data) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _bytes(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _digest(source: Path) -> bytes:
+    return hashlib.blake2b(source.read_bytes(), digest_size=16).digest()
+
+
+def compile_vocab(terms: List[Term], out: Path = path, source: Path = csv_path):
+    ranks = array("i", [NO_RANK if t.rank is None else t.rank for t in terms])
+    flags = bytes([t.ambiguous for t in terms])
+    # Lengths are in characters of the decoded blob, so that each string is a
+    # slice of it.
+    strings = [getattr(term, name) or "" for term in terms for name in STRINGS]
+    lengths = array("I", [len(s) for s in strings])
+    blob = "".join(strings).encode("utf-8")
+
+    tmp = out.with_suffix(".part")
+    with open(tmp, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(terms), len(blob), _digest(source)))
+        file.write(_bytes(ranks))
+        file.write(flags)
+        file.write(_bytes(lengths))
+        file.write(blob)
+    tmp.replace(out)
+
+
+def load(src: Path = path, source: Path = csv_path) -> List[Term]:
+    with open(src, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, count, blob_size, digest = HEADER.unpack_from(data)
+            if magic != MAGIC:
+                raise ValueError(f"Not a compiled vocab: {src}")
+            if source.exists() and _digest(source) != digest:
+                raise ValueError(f"Compiled vocab is out of date: {src}")
+            sizes = [4 * count, count, 4 * len(STRINGS) * count, blob_size]
+            sections = []
+            start = HEADER.size
+            for size in sizes:
+                end = start + size
+                sections.append(data[start:end])
+                start = end
+    ranks = _array("i", sections[0])
+    flags = sections[1]
+    offsets = [0, *accumulate(_array("I", sections[2]))]
+    blob = sections[3].decode("utf-8")
+
+    strings = iter([blob[a:b] for a, b in zip(offsets, offsets[1:])])
+    return [
+        Term.from_fields(
+            None if rank == NO_RANK else rank,
+            word,
+            hanja or None,
+            notes or None,
+            difficulty,
+            ambiguous == 1,
+        )
+        for rank, ambiguous, (word, hanja, notes, difficulty) in zip(
+            ranks, flags, zip(*[strings] * len(STRINGS))
+        )
+    ]
+
+
+if __name__ == "__main__":
+    from .prestudy import _load_csv
+
+    compile_vocab(_load_csv())
+    print(f"Wrote {path}")
@@ -1,16 +1,56 @@
 #!/usr/bin/env python3
+"""
+Builds package.ankiaddon.
+
+    ./package.py [--reproducible] [--clean]
+
+The build is incremental: every input (source file, compiled vocab, vendored
+dependency) is fingerprinted, only the ones that changed since the last build
+are copied into `package/` again, and the zip is updated by copying the
+unchanged members over from the previous one as they are.
+
+With --reproducible, or when SOURCE_DATE_EPOCH is set, every member of the zip
+gets the same timestamp and permissions, so that the same inputs always give
+the same bytes.
+
+With --slim, the modules of vendored dependencies that jjigae never imports
+are left out, found by running it against a fake Anki (tests/bundle_probe.py),
+along with tests, C sources and the data of tokenizers we don't use, and the
+package ships bytecode compiled by --python, which should be the same Python
+version as Anki's. Bundle size and import time are reported before and after.
+"""
+
+import argparse
+import copy
+import fnmatch
 import glob
+import hashlib
+import json
 import os
 import re
 import requests
 import shutil
+import struct
 import subprocess
+import sys
 import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from urllib import request
 
-SOURCE_FILES = ["main.py", "jjigae/hanjadic.sqlite", "jjigae/vocab.csv"] + glob.glob(
-    f"jjigae/*.py"
-)
+SOURCE_FILES = [
+    "main.py",
+    "manifest.json",
+    "config.json",
+    "config.md",
+    "jjigae/hanjadic.sqlite",
+    "jjigae/vocab.csv",
+    "jjigae/vocab.bin",
+] + glob.glob(f"jjigae/*.py")
+
+# Where source files go in the package, when not at the same path.
+RENAMES = {"main.py": "__init__.py"}
 
 DEPENDENCIES_PYPI = [  # [dep.strip() for dep in open("requirements.txt").readlines()] + [
     # "beautifulsoup4",
@@ -25,27 +65,131 @@ DEPENDENCIES_LOCAL = ["beautifulsoup4", "lxml", "requests"] + [
     x.strip() for x in open("requirements.txt").readlines()
 ]
 
+# Edits to vendored files, as (pattern, replacement) pairs.
+PATCHES = {
+    "ndic/__init__.py": [(r"(?m)^.*get_distribution.*\n", "")],
+    "ndic/utils.py": [(r"lxml", "html.parser")],
+}
+
+PACKAGE_DIR = "package"
+
 PACKAGE_CACHE_DIR = "package_cache"
 
+# Fingerprints of the inputs of the last build.
+BUILD_STATE = os.path.join(PACKAGE_CACHE_DIR, "build_state.json")
+
 OUTPUT_FILE_NAME = "package.ankiaddon"
 
+VOCAB_INPUTS = ["jjigae/vocab.csv", "jjigae/vocab_store.py"]
+
+# Files of vendored dependencies left out of slim packages, on top of modules
+# that are never imported.
+SLIM_PRUNE = [
+    "*/tests/*",
+    "*/test/*",
+    "*.pyx",
+    "*.pxd",
+    "*.pxi",
+    "*.pyi",
+    "*.c",
+    "*.h",
+    "lxml/includes/*",
+    # The other taggers of konlpy. Okt needs its own interface class, under
+    # konlpy/java/bin/kr/lucypark/okt, and the open-korean-text, scala-library
+    # and twitter-text jars.
+    "konlpy/java/kkma-*.jar",
+    "konlpy/java/jhannanum-*.jar",
+    "konlpy/java/komoran-*.jar",
+    "konlpy/java/shineware-*.jar",
+    "konlpy/java/bin/kr/lucypark/kkma/*",
+    "konlpy/java/bin/kr/lucypark/komoran/*",
+    "konlpy/java/bin/kr/lucypark/jhannanum/*",
+    "konlpy/java/conf/*",
+    "konlpy/java/data/*",
+    "konlpy/data/corpus/*",
+]
+
+MODULE_SUFFIXES = (".py", ".so", ".pyd")
+
+# How many times to import the add-on when timing it, keeping the fastest.
+IMPORT_RUNS = 3
+
+SLIM_REPORT = os.path.join(PACKAGE_CACHE_DIR, "slim_report.json")
+
+# The earliest time a zip can hold.
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+def _hash_file(path, digest):
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+
+
+def _walk(directory, bytecode=False):
+    """The files under `directory`, relative to it, in a stable order."""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames[:] = sorted(d for d in dirnames if bytecode or d != "__pycache__")
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            paths.append(os.path.relpath(path, directory).replace(os.sep, "/"))
+    return sorted(paths)
 
-def prepare_package_dir_and_zip():
-    shutil.rmtree("package", ignore_errors=True)
-    os.mkdir("package")
+
+def fingerprint(src, dest):
+    """
+    A hash of the contents of a source file, or of the names, sizes and
+    modification times of the files of a dependency, along with the patches
+    that apply to it.
+    """
+    digest = hashlib.sha256()
+    if os.path.isdir(src):
+        for name in _walk(src):
+            stat = os.stat(os.path.join(src, name))
+            digest.update(f"{name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    else:
+        _hash_file(src, digest)
+    patches = {path: p for path, p in PATCHES.items() if _under(path, [dest])}
+    digest.update(json.dumps(patches, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _under(path, dests):
+    return any(path == dest or path.startswith(dest + "/") for dest in dests)
+
+
+def load_state():
     try:
-        os.remove(OUTPUT_FILE_NAME)
-    except OSError as e:
-        if e.errno != 2:
-            raise
+        with open(BUILD_STATE) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
 
 
-def copy_source_files():
-    for f in SOURCE_FILES:
-        dirname, filename = os.path.split(f)
-        target_dirname = os.path.join("package", dirname)
-        os.makedirs(target_dirname, exist_ok=True)
-        shutil.copy(f, target_dirname)
+def save_state(state):
+    os.makedirs(PACKAGE_CACHE_DIR, exist_ok=True)
+    with open(BUILD_STATE, "w") as file:
+        json.dump(state, file, indent=2, sort_keys=True)
+
+
+def clean():
+    shutil.rmtree(PACKAGE_DIR, ignore_errors=True)
+    for path in [OUTPUT_FILE_NAME, BUILD_STATE]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def compile_vocab(state):
+    digest = hashlib.sha256()
+    for path in VOCAB_INPUTS:
+        _hash_file(path, digest)
+    vocab = digest.hexdigest()
+    if state.get("vocab") != vocab or not os.path.exists("jjigae/vocab.bin"):
+        subprocess.check_call([sys.executable, "-m", "jjigae.vocab_store"])
+    state["vocab"] = vocab
 
 
 def retrieve_with_cache(url, dest_path):
@@ -106,49 +250,359 @@ def _path_to_sort_tuple(path):
     return (is_user,) + version_tuple
 
 
-def copy_dependencies_from_local():
+def resolve_dependency(dep_pkg_name):
+    """
+    The installed directory or module of a dependency, and where it goes in
+    the package.
+    """
+    pkg_name = OVERRIDES[dep_pkg_name] if dep_pkg_name in OVERRIDES else dep_pkg_name
+    # Exact matches first: `gtts*` also matches gtts_token.
+    for site_packages in glob.glob("venv/lib/python3.*/site-packages"):
+        for dirpath in [pkg_name, f"{pkg_name}.py"]:
+            dirpath = os.path.join(site_packages, dirpath)
+            if os.path.exists(dirpath):
+                return dirpath, os.path.basename(dirpath)
+    dirpaths = glob.glob(f"venv/lib/python3.*/site-packages/{pkg_name}*")
+    dirpaths = [path for path in dirpaths if not path.endswith("dist-info")]
+    dirpath = dirpaths[-1]
+    subdirpath = os.path.join(dirpath, pkg_name)
+    if os.path.exists(subdirpath):
+        dirpath = subdirpath
+    if os.path.isdir(dirpath):
+        return dirpath, pkg_name
+    return dirpath, os.path.basename(dirpath)
+
+
+def inputs():
+    """What goes into the package, as {name: (source path, path in package)}."""
+    units = {f: (f, RENAMES.get(f, f)) for f in SOURCE_FILES}
     for dep_pkg_name in DEPENDENCIES_LOCAL:
-        pkg_name = (
-            OVERRIDES[dep_pkg_name] if dep_pkg_name in OVERRIDES else dep_pkg_name
-        )
-        dirpaths = glob.glob(f"venv/lib/python3.*/site-packages/{pkg_name}*")
-        dirpaths = [path for path in dirpaths if not path.endswith("dist-info")]
-        dirpath = dirpaths[-1]
-        subdirpath = os.path.join(dirpath, pkg_name)
-        if os.path.exists(subdirpath):
-            dirpath = subdirpath
-        if os.path.isdir(dirpath):
-            shutil.copytree(
-                dirpath,
-                f"package/{pkg_name}",
-                ignore=shutil.ignore_patterns("__pycache__"),
-            )
-        else:
-            shutil.copy(dirpath, f"package/")
-
-
-def create_package_zip_file():
-    shutil.copy("manifest.json", "package/")
-    subprocess.check_call(["zip", f"../{OUTPUT_FILE_NAME}", "-r", "."], cwd="package")
+        units[f"dependency:{dep_pkg_name}"] = resolve_dependency(dep_pkg_name)
+    return units
+
+
+def _remove(dest, directory=PACKAGE_DIR):
+    path = os.path.join(directory, dest)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _patch(dest, directory):
+    for path, patches in PATCHES.items():
+        if not _under(path, [dest]):
+            continue
+        path = os.path.join(directory, path)
+        with open(path) as file:
+            text = file.read()
+        for pattern, replacement in patches:
+            text = re.sub(pattern, replacement, text)
+        with open(path, "w") as file:
+            file.write(text)
+
+
+def copy_input(src, dest, directory=PACKAGE_DIR):
+    _remove(dest, directory)
+    path = os.path.join(directory, dest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.isdir(src):
+        shutil.copytree(src, path, ignore=shutil.ignore_patterns("__pycache__"))
+    else:
+        shutil.copy(src, path)
+    _patch(dest, directory)
+
+
+def _probe(command, directory):
+    """Run tests/bundle_probe.py on `directory`, returning its result."""
+    output = subprocess.run(
+        [sys.executable, "-m", "tests.bundle_probe", command, directory],
+        env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1"),
+        stdout=subprocess.PIPE,
+        check=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def measure(directory):
+    """The number of files and bytes under `directory`, and its import time."""
+    names = _walk(directory, bytecode=True)
+    return dict(
+        files=len(names),
+        bytes=sum(os.path.getsize(os.path.join(directory, name)) for name in names),
+        import_seconds=min(_probe("import", directory) for _ in range(IMPORT_RUNS)),
+    )
 
 
-def remove_bad_things():
+def trace(units):
+    """
+    The module files jjigae imports from a full package, and its measurements.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        with ThreadPoolExecutor() as pool:
+            list(pool.map(lambda unit: copy_input(*unit, directory), units.values()))
+        return dict(modules=_probe("trace", directory), before=measure(directory))
+
+
+def _unused(relpath, modules, packages):
+    """
+    Whether a file is a module that was never imported, or belongs to a
+    package that was never imported.
+    """
+    if relpath.endswith(MODULE_SUFFIXES):
+        return relpath not in modules
+    package = os.path.dirname(relpath)
+    while package and package not in packages:
+        package = os.path.dirname(package)
+    return bool(package) and f"{package}/__init__.py" not in modules
+
+
+def prune(dests, modules):
+    """
+    Remove from the dependencies at `dests` what isn't used, according to the
+    module files in `modules`, and the files matching `SLIM_PRUNE`.
+    """
+    modules = set(modules)
+    removed = 0
+    for dest in dests:
+        path = os.path.join(PACKAGE_DIR, dest)
+        names = _walk(path) if os.path.isdir(path) else [""]
+        relpaths = [os.path.join(dest, name) if name else dest for name in names]
+        packages = {
+            os.path.dirname(relpath)
+            for relpath in relpaths
+            if os.path.basename(relpath) == "__init__.py"
+        }
+        for relpath in relpaths:
+            if _unused(relpath, modules, packages) or any(
+                fnmatch.fnmatch(relpath, pattern) for pattern in SLIM_PRUNE
+            ):
+                os.remove(os.path.join(PACKAGE_DIR, relpath))
+                removed += 1
+        for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+            if not os.listdir(dirpath):
+                os.rmdir(dirpath)
+    return removed
+
+
+def compile_bytecode(python):
+    """
+    Compile the package with `python`, into hash-based .pyc files, which stay
+    valid when Anki unpacks the package with new timestamps.
+    """
     subprocess.check_call(
-        ["sed", "-i.bu", "/get_distribution/d", "ndic/__init__.py"], cwd="package"
-    )
-    subprocess.check_call(
-        ["sed", "-i.bu", "s/lxml/html.parser/", "ndic/utils.py"], cwd="package"
+        [
+            python,
+            "-m",
+            "compileall",
+            "-q",
+            "--invalidation-mode=checked-hash",
+            PACKAGE_DIR,
+        ]
     )
 
 
-def rename_entry_point():
-    shutil.move("package/main.py", "package/__init__.py")
+def _report(before, after):
+    lines = [f"{'':<8} {'files':>7} {'size':>10} {'import':>8}"]
+    for name, m in [("full", before), ("slim", after)]:
+        lines.append(
+            f"{name:<8} {m['files']:>7} {m['bytes'] / 1e6:>7.1f} MB"
+            f" {m['import_seconds']:>7.2f}s"
+        )
+    return "\n".join(lines)
+
+
+def zip_date_time():
+    epoch = os.environ.get("SOURCE_DATE_EPOCH")
+    if epoch is None:
+        return ZIP_EPOCH
+    return max(ZIP_EPOCH, time.gmtime(int(epoch))[:6])
+
+
+def _source_of(name):
+    """The source of a .pyc file, or the file itself."""
+    dirname, filename = os.path.split(name)
+    if os.path.basename(dirname) != "__pycache__":
+        return name
+    return os.path.join(os.path.dirname(dirname), filename.split(".")[0] + ".py")
+
+
+def _write_member(archive, directory, name, reproducible):
+    path = os.path.join(directory, name)
+    info = zipfile.ZipInfo.from_file(path, name, strict_timestamps=False)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    if reproducible:
+        info.date_time = zip_date_time()
+        info.create_system = 3
+        info.external_attr = 0o644 << 16
+    with open(path, "rb") as file:
+        archive.writestr(info, file.read())
+
+
+def _copy_member(old, new, info):
+    """
+    Copy a member from one zip to another, still compressed. Returns False
+    for members that can't be copied that way.
+    """
+    if info.flag_bits & 0x08:
+        # The sizes follow the data, in a descriptor.
+        return False
+    old.fp.seek(info.header_offset)
+    header = old.fp.read(zipfile.sizeFileHeader)
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    size = name_length + extra_length + info.compress_size
+    member = copy.copy(info)
+    member.header_offset = new.fp.tell()
+    new.fp.write(header)
+    new.fp.write(old.fp.read(size))
+    new.filelist.append(member)
+    new.NameToInfo[member.filename] = member
+    new.start_dir = new.fp.tell()
+    return True
+
+
+def update_zip(path, directory, changed, reproducible=False, bytecode=False):
+    """
+    Bring the zip at `path` up to date with `directory`. Files under the
+    `changed` paths, or compiled from them, and files the zip doesn't have
+    yet, are compressed again, and the others are copied over from the old
+    zip. Returns how many files were compressed, and how many there are in all.
+    """
+    names = _walk(directory, bytecode)
+    old = zipfile.ZipFile(path) if os.path.exists(path) else None
+    written = 0
+    tmp = path + ".part"
+    try:
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as new:
+            for name in names:
+                info = None if old is None else old.NameToInfo.get(name)
+                if info is not None and not _under(_source_of(name), changed):
+                    if _copy_member(old, new, info):
+                        continue
+                _write_member(new, directory, name, reproducible)
+                written += 1
+    finally:
+        if old is not None:
+            old.close()
+    os.replace(tmp, path)
+    return written, len(names)
+
+
+def _up_to_date(state, name, dest, fingerprint):
+    if state["inputs"].get(name) != fingerprint:
+        return False
+    if dest in state.get("pruned", []):
+        return True
+    return os.path.exists(os.path.join(PACKAGE_DIR, dest))
+
+
+def build(reproducible=False, slim=False, python=sys.executable):
+    state = load_state()
+    date_time = list(zip_date_time()) if reproducible else None
+    mode = dict(slim=slim, python=python if slim else None)
+    built = os.path.isdir(PACKAGE_DIR) and "inputs" in state
+    if not built or state.get("mode", dict(slim=False, python=None)) != mode:
+        clean()
+        state = {"inputs": {}, "outputs": {}}
+    if state.get("zip_date_time") != date_time and os.path.exists(OUTPUT_FILE_NAME):
+        # Every member of the zip needs new timestamps.
+        os.remove(OUTPUT_FILE_NAME)
+    os.makedirs(PACKAGE_DIR, exist_ok=True)
+
+    compile_vocab(state)
+    copy_dependencies_from_pypi()
+
+    units = inputs()
+    with ThreadPoolExecutor() as pool:
+        fingerprints = dict(
+            zip(units, pool.map(lambda unit: fingerprint(*unit), units.values()))
+        )
+        if slim:
+            key = hashlib.sha256(json.dumps(fingerprints, sort_keys=True).encode())
+            if state.get("trace", {}).get("key") != key.hexdigest():
+                print("Tracing imports...")
+                state["trace"] = dict(trace(units), key=key.hexdigest())
+                # What to leave out may have changed for every dependency.
+                state["inputs"] = {}
+        stale = [
+            name
+            for name, (src, dest) in units.items()
+            if not _up_to_date(state, name, dest, fingerprints[name])
+        ]
+        for name, dest in state.get("outputs", {}).items():
+            if name not in units:
+                _remove(dest)
+        # Copying is mostly waiting on the disk, so copies overlap nicely.
+        list(pool.map(lambda name: copy_input(*units[name]), stale))
+
+    changed = [units[name][1] for name in stale]
+    if slim:
+        removed = prune(
+            [units[name][1] for name in stale if name.startswith("dependency:")],
+            state["trace"]["modules"],
+        )
+        print(f"Left out {removed} unused files")
+        state["pruned"] = [
+            dest
+            for src, dest in units.values()
+            if not os.path.exists(os.path.join(PACKAGE_DIR, dest))
+        ]
+        compile_bytecode(python)
+    written, total = update_zip(
+        OUTPUT_FILE_NAME, PACKAGE_DIR, changed, reproducible, bytecode=slim
+    )
+
+    state.update(
+        mode=mode,
+        zip_date_time=date_time,
+        inputs=fingerprints,
+        outputs={name: dest for name, (src, dest) in units.items()},
+    )
+    save_state(state)
+    print(
+        f"Copied {len(stale)} of {len(units)} inputs, "
+        f"compressed {written} of {total} files into {OUTPUT_FILE_NAME}"
+    )
+    if slim:
+        report = dict(
+            before=state["trace"]["before"],
+            after=measure(PACKAGE_DIR),
+            zip_bytes=os.path.getsize(OUTPUT_FILE_NAME),
+        )
+        with open(SLIM_REPORT, "w") as file:
+            json.dump(report, file, indent=2)
+        print(_report(report["before"], report["after"]))
+        print(f"{OUTPUT_FILE_NAME}: {report['zip_bytes'] / 1e6:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build package.ankiaddon.")
+    parser.add_argument(
+        "--reproducible",
+        action="store_true",
+        default="SOURCE_DATE_EPOCH" in os.environ,
+        help="give every file in the zip the same timestamp, SOURCE_DATE_EPOCH "
+        "or 1980-01-01",
+    )
+    parser.add_argument(
+        "--clean", action="store_true", help="rebuild everything from scratch"
+    )
+    parser.add_argument(
+        "--slim",
+        action="store_true",
+        help="leave out what jjigae doesn't use, and ship bytecode",
+    )
+    parser.add_argument(
+        "--python",
+        default=sys.executable,
+        help="the Python to compile bytecode with, for --slim",
+    )
+    args = parser.parse_args()
+    if args.clean:
+        clean()
+    build(args.reproducible, args.slim, args.python)
 
 
-prepare_package_dir_and_zip()
-copy_source_files()
-copy_dependencies_from_pypi()
-copy_dependencies_from_local()
-remove_bad_things()
-rename_entry_point()
-create_package_zip_file()
+if __name__ == "__main__":
+    main()
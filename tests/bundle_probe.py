@@ -0,0 +1,79 @@
+"""
+Runs jjigae from a built package directory, against the fake Anki and the
+local stand-ins, for package.py --slim.
+
+    python -m tests.bundle_probe trace package
+    python -m tests.bundle_probe import package
+
+`trace` goes through loading the add-on, "Fill missing", adding prestudy notes
+and loading the tokenizer (which needs a JVM), and prints the files of the modules it imported
+from the directory. `import` prints how long importing the add-on took, in
+seconds. Either prints its result as JSON, on the last line.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def _import(directory: str):
+    from tests import fake_anki
+
+    tmp = Path(tempfile.mkdtemp())
+    (tmp / "media").mkdir()
+    mw = fake_anki.install(str(tmp / "media"))
+    # What Anki imports when loading the add-on.
+    from jjigae import core
+
+    fake_anki.isolate(tmp)
+    return mw, tmp
+
+
+def trace(directory: str) -> list:
+    mw, tmp = _import(directory)
+    from jjigae import core, prestudy, tts, ui
+    from tests.stand_ins import StandIns
+
+    tts.BACKOFF = 0
+    core.load()
+    mw.col.add_notes(
+        [["사람", "", "", "", "", ""], ["<b>과학</b>", "", "", "", "", ""]]
+    )
+    # Going through errors too.
+    with StandIns(error_rate=0.5):
+        core.fill_missing()
+    with StandIns():
+        ui.add_notes(prestudy._vocab.get().terms[:2], "Default", [])
+    # Fails the build when the package can't tokenize, e.g. with Okt's
+    # classes left out. This needs a JVM.
+    prestudy.okt.get()
+
+    root = os.path.realpath(directory)
+    files = set()
+    for module in list(sys.modules.values()):
+        path = getattr(module, "__file__", None)
+        if isinstance(path, str) and os.path.realpath(path).startswith(root + os.sep):
+            files.add(os.path.relpath(os.path.realpath(path), root))
+    return sorted(files)
+
+
+def import_time(directory: str) -> float:
+    start = time.perf_counter()
+    _import(directory)
+    return time.perf_counter() - start
+
+
+def main(command: str, directory: str):
+    # Import jjigae and its dependencies from `directory`, not from the tree.
+    sys.path.insert(0, os.path.abspath(directory))
+    if command == "trace":
+        print(json.dumps(trace(directory)))
+    else:
+        print(json.dumps(import_time(directory)))
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
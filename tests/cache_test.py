@@ -0,0 +1,96 @@
+import threading
+
+from jjigae.cache import BATCH_SIZE, Cache, MISSING
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_or_compute_only_computes_misses(tmp_path):
+    cache = Cache(tmp_path / "cache.sqlite")
+    calls = []
+
+    def compute(key):
+        calls.append(key)
+        return key.upper()
+
+    assert cache.get_or_compute("a", compute) == "A"
+    assert cache.get_or_compute("a", compute) == "A"
+    assert calls == ["a"]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_persists_across_instances(tmp_path):
+    Cache(tmp_path / "cache.sqlite").set("감정", "feelings")
+    assert Cache(tmp_path / "cache.sqlite").get("감정") == "feelings"
+
+
+def test_entries_expire(tmp_path):
+    clock = Clock()
+    cache = Cache(tmp_path / "cache.sqlite", ttl=100, negative_ttl=10, clock=clock)
+    cache.set("found", "value")
+    cache.set("not found", "")
+    clock.now += 50
+    assert cache.get("found") == "value"
+    assert cache.get("not found") is MISSING
+
+
+def test_evicts_least_recently_used(tmp_path):
+    clock = Clock()
+    cache = Cache(tmp_path / "cache.sqlite", max_entries=2, clock=clock)
+    for key in ["a", "b", "c"]:
+        clock.now += 1
+        cache.set(key, key)
+        if key == "b":
+            clock.now += 1
+            cache.get("a")
+    cache.evict()
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == "a"
+    assert cache.get("c") == "c"
+
+
+def test_get_many(tmp_path):
+    clock = Clock()
+    cache = Cache(tmp_path / "cache.sqlite", ttl=100, clock=clock)
+    cache.set_many([("old", "stale")])
+    clock.now += 200
+    cache.set_many([("a", "A"), ("b", "B")])
+    keys = ["a", "missing", "old", "b", "a"]
+    assert cache.get_many(keys) == ["A", MISSING, MISSING, "B", "A"]
+    assert (cache.hits, cache.misses) == (3, 2)
+    assert cache.get_many(keys) == [cache.get(key) for key in keys]
+
+
+def test_get_many_queries_by_batch(tmp_path):
+    cache = Cache(tmp_path / "cache.sqlite")
+    keys = [str(i) for i in range(2 * BATCH_SIZE + 1)]
+    cache.set_many((key, key) for key in keys)
+    statements = []
+    cache._conn().set_trace_callback(statements.append)
+    assert cache.get_many(keys) == keys
+    # A select and an update of the access times per batch.
+    assert len(statements) == 6
+
+
+def test_counts_add_up_across_threads(tmp_path):
+    cache = Cache(tmp_path / "cache.sqlite")
+    cache.set("a", "A")
+
+    def work():
+        for _ in range(200):
+            cache.get("a")
+            cache.get("missing")
+            cache.get_many(["a", "missing"])
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert (cache.hits, cache.misses) == (1600, 1600)
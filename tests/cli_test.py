@@ -0,0 +1,53 @@
+import json
+from functools import partial
+
+import genanki
+
+from jjigae import augmentation, cli, instrumentation, tts
+from jjigae.cache import Cache
+from jjigae.models import get_model
+from tests.stand_ins import StandIns
+
+OTHER_MODEL = genanki.Model(
+    1234,
+    "Korean (other)",
+    fields=[{"name": "Korean"}, {"name": "Meaning"}],
+    templates=[{"name": "Card 1", "qfmt": "{{Korean}}", "afmt": "{{Meaning}}"}],
+)
+
+
+def _apkg(path):
+    deck = genanki.Deck(42, "Korean")
+    deck.add_note(
+        genanki.Note(get_model(), ["사람", "", "", "", "", ""], tags=["a"], guid="jj")
+    )
+    deck.add_note(genanki.Note(OTHER_MODEL, ["과학", "science"], guid="other"))
+    genanki.Package(deck).write_to_file(str(path))
+
+
+def test_fill_round_trips_jjigae_notes(tmp_path, monkeypatch, capsys):
+    ndic_cache = Cache(tmp_path / "ndic.sqlite")
+    monkeypatch.setattr(augmentation, "ndic_cache", ndic_cache)
+    monkeypatch.setattr(cli, "ndic_cache", ndic_cache)
+    # Set by the CLI.
+    monkeypatch.setattr(tts, "MEDIA_DIR", None)
+    monkeypatch.setattr(
+        cli,
+        "write_report",
+        partial(instrumentation.write_report, directory=tmp_path / "reports"),
+    )
+    _apkg(tmp_path / "in.apkg")
+    out = tmp_path / "out.apkg"
+
+    with StandIns():
+        cli.main(["fill", str(tmp_path / "in.apkg"), "--output", str(out)])
+
+    events = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert events[0] == dict(event="start", notes=1, skipped=1)
+    assert events[-1]["skipped"] == 1
+    notes = list(cli.read_notes(str(out), str(tmp_path)))
+    assert len(notes) == 1
+    guid, mid, tags, fields = notes[0]
+    assert (guid, mid, tags) == ("jj", get_model().model_id, ["a"])
+    assert fields["English"] == "english for 사람"
+    assert fields["Sound"] == "사람_G_ko.mp3"
@@ -0,0 +1,146 @@
+import tempfile
+import types
+from pathlib import Path
+
+from tests import fake_anki
+from tests.stand_ins import StandIns
+
+fake_anki.install(tempfile.mkdtemp())
+
+from jjigae import core, journal, tts  # noqa: E402
+
+
+def _setup(tmp_path: Path, notes):
+    media = tmp_path / "media"
+    media.mkdir()
+    mw = fake_anki.install(str(media))
+    fake_anki.isolate(tmp_path)
+    mw.col.add_notes(notes)
+    return mw
+
+
+def _fields(mw, nid):
+    return dict(mw.col.getNote(nid))
+
+
+def test_fill_missing(tmp_path):
+    mw = _setup(
+        tmp_path,
+        [
+            ["사람", "", "", "", "", ""],
+            ["<b>과학</b>", "science", "", "", "", ""],
+            ["사람", "", "", "", "", ""],
+        ],
+    )
+    with StandIns() as services:
+        core.fill_missing()
+
+    first = _fields(mw, 1)
+    assert first["English"] == "english for 사람"
+    assert first["Sound"] == "사람_G_ko.mp3"
+    assert (tmp_path / "media" / "사람_G_ko.mp3").read_bytes().startswith(b"ID3")
+    assert _fields(mw, 2)["English"] == "science"
+    assert _fields(mw, 3) == first
+    # Duplicates are looked up once.
+    assert services.requests == {"ndic": 1, "tts": 2}
+    assert mw.tooltips[-1].startswith("Updated 3 of 3 notes")
+
+
+def test_retry_failed(tmp_path, monkeypatch):
+    monkeypatch.setattr(tts, "BACKOFF", 0)
+    mw = _setup(tmp_path, [["사람", "", "", "", "", ""]])
+    monkeypatch.setattr(
+        core,
+        "open_journal",
+        lambda: core.Journal(tmp_path / "fill_journal.sqlite", backoff=0),
+    )
+    with StandIns(error_rate=1.0):
+        core.fill_missing()
+    assert _fields(mw, 1)["English"] == ""
+    assert "1 notes failed" in mw.tooltips[-1]
+
+    journal = core.open_journal()
+    assert set(journal.failures()[1]) == {"English", "Sound"}
+    journal.close()
+
+    with StandIns():
+        core.retry_failed()
+    assert _fields(mw, 1)["English"] == "english for 사람"
+    assert mw.tooltips[-1].startswith("Retried 1 notes, updated 1, 0 still failing")
+
+
+def test_warm_up_is_opt_in(tmp_path, monkeypatch):
+    _setup(tmp_path, [])
+    warmed = []
+    monkeypatch.setattr(
+        core.lazy, "warm_up", lambda resources: warmed.append(resources)
+    )
+    core.warm_up()
+    assert warmed == []
+
+    core.set_config(warm_up=True)
+    core.warm_up()
+    assert [r.name for r in warmed[0]] == ["vocab", "hanja"]
+
+
+def test_journal_is_kept_per_profile(tmp_path):
+    for profile in ("first", "second"):
+        (tmp_path / profile / "collection.media").mkdir(parents=True)
+    fake_anki.install(str(tmp_path / "first" / "collection.media"))
+    first = journal.open_journal()
+    first.record(None, 1, {"English": "failed"})
+    first.commit()
+    first.close()
+
+    fake_anki.install(str(tmp_path / "second" / "collection.media"))
+    second = journal.open_journal()
+    assert second.failures() == {}
+    second.close()
+    assert (tmp_path / "first" / "jjigae_fill_journal.sqlite").exists()
+
+
+def test_fill_missing_uses_silhouette_mode(tmp_path):
+    mw = _setup(tmp_path, [["사과 주스", "", "", "", "", ""]])
+    core.set_config(silhouette="choseong")
+    with StandIns():
+        core.fill_missing()
+    assert _fields(mw, 1)["Silhouette"] == "ㅅㄱ ㅈㅅ"
+
+
+def test_background_write_back_skips_notes_in_editors(tmp_path):
+    mw = _setup(tmp_path, [["사람", "", "", "", "", ""], ["과학", "", "", "", "", ""]])
+    enrichment = core.BackgroundEnrichment(core.QAction())
+    results = [
+        (nid, dict(_fields(mw, nid), English=f"english for {nid}")) for nid in (1, 2)
+    ]
+    enrichment.enricher.results = lambda: results
+    browser = types.SimpleNamespace(
+        editor=types.SimpleNamespace(note=mw.col.getNote(1))
+    )
+    mw.app.windows.append(browser)
+    mw.col.db.execute(
+        "UPDATE notes SET flds = ? WHERE id = 2", "과학\x1fscience\x1f\x1f\x1f\x1f"
+    )
+
+    enrichment.write_back()
+    assert _fields(mw, 1)["English"] == ""
+    assert _fields(mw, 2)["English"] == "science"
+    assert list(enrichment.deferred) == [1]
+
+    mw.app.windows.remove(browser)
+    results = []
+    enrichment.write_back()
+    assert _fields(mw, 1)["English"] == "english for 1"
+    assert enrichment.deferred == {}
+
+
+def test_write_chunk_size_is_read_from_config(tmp_path):
+    mw = _setup(tmp_path, [["사람", "", "", "", "", ""]] * 5)
+    core.set_config(write_chunk_size=2)
+    with StandIns():
+        core.fill_missing()
+    # Two full chunks, then the last note.
+    assert mw.col.saves == 3
+
+    core.set_config(write_chunk_size=0)
+    assert core.write_chunk_size() == core.WRITE_CHUNK_SIZE
@@ -0,0 +1,84 @@
+import threading
+import time
+
+from jjigae.enrichment import Enricher
+from jjigae.pipeline import FillPipeline
+
+
+def _pipeline(lookup=lambda korean: f"english for {korean}"):
+    return FillPipeline(
+        cleanup=lambda txt: (txt or "").strip(),
+        lookup=lookup,
+        hanja=lambda koreans: {},
+        silhouette=lambda korean: "_ " * len(korean),
+        tts=lambda korean: f"{korean}_G_ko.mp3",
+    )
+
+
+def _note(korean):
+    return {"Korean": korean, "English": "", "Silhouette": "", "Sound": ""}
+
+
+def _wait_for(enricher, count, timeout=5):
+    results = []
+    deadline = time.monotonic() + timeout
+    while len(results) < count and time.monotonic() < deadline:
+        results += enricher.results()
+        time.sleep(0.01)
+    return dict(results)
+
+
+def test_enriches_submitted_notes():
+    enricher = Enricher(_pipeline(), pause=0)
+    enricher.start()
+    try:
+        enricher.submit(1, _note("감정"))
+        enricher.submit(2, _note("사람"))
+        results = _wait_for(enricher, 2)
+    finally:
+        enricher.stop()
+
+    assert results[1]["English"] == "english for 감정"
+    assert results[2]["Sound"] == "사람_G_ko.mp3"
+    assert enricher.depth == 0
+    assert len(enricher.latencies) == 2
+
+
+def test_resubmitting_replaces_the_queued_note():
+    enricher = Enricher(_pipeline(), pause=0)
+    enricher.submit(1, _note("감정"))
+    enricher.submit(1, _note("사람"))
+    assert enricher.depth == 1
+
+    enricher.start()
+    try:
+        results = _wait_for(enricher, 1)
+    finally:
+        enricher.stop()
+
+    assert results[1]["Korean"] == "사람"
+
+
+def test_reports_depth_and_lag():
+    now = [100.0]
+    release = threading.Event()
+
+    def lookup(korean):
+        release.wait()
+        return korean
+
+    enricher = Enricher(_pipeline(lookup), pause=0, clock=lambda: now[0])
+    enricher.submit(1, _note("감정"))
+    now[0] += 3
+    enricher.submit(2, _note("사람"))
+    now[0] += 2
+    enricher.start()
+    try:
+        assert enricher.depth == 2
+        assert enricher.lag == 5
+    finally:
+        release.set()
+        _wait_for(enricher, 2)
+        enricher.stop()
+    assert enricher.depth == 0
+    assert enricher.lag == 0
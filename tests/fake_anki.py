@@ -0,0 +1,347 @@
+"""
+A minimal in-memory stand-in for the parts of `aqt` and `anki` that jjigae
+uses, so that `jjigae.core`, `jjigae.ui` and `jjigae.models` can run without
+Anki, in tests and benchmarks.
+
+    from tests import fake_anki
+    mw = fake_anki.install(media_dir)
+    mw.col.add_notes(...)
+    from jjigae import core
+    fake_anki.isolate(directory)
+
+Notes live in an in-memory SQLite `notes` table like Anki's, so that loading
+and flushing notes costs about what it does in Anki.
+"""
+
+import json
+import sqlite3
+import sys
+import time
+import types
+import zipfile
+from functools import partial
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+ROOT_DIR = Path(__file__).parent.parent
+
+KOREAN_FIELDS = ["Korean", "English", "Hanja", "Sound", "Silhouette", "Comment"]
+
+MODEL_ID = 1
+
+DECK_ID = 1
+
+
+class Note(object):
+    def __init__(self, col, nid: int, mid: int, fields: List[str]):
+        self.col = col
+        self.id = nid
+        self.mid = mid
+        self._names = col.field_names[mid]
+        self.fields = fields
+
+    def keys(self) -> List[str]:
+        return list(self._names)
+
+    def items(self):
+        return list(zip(self._names, self.fields))
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._names
+
+    def __getitem__(self, name: str) -> str:
+        return self.fields[self._names.index(name)]
+
+    def __setitem__(self, name: str, value: str):
+        self.fields[self._names.index(name)] = value
+
+    def flush(self, mod=None):
+        self.col.db.execute(
+            "UPDATE notes SET flds = ?, mod = ? WHERE id = ?",
+            "\x1f".join(self.fields),
+            mod or int(time.time()),
+            self.id,
+        )
+
+
+class DB(object):
+    def __init__(self):
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE notes (id INTEGER PRIMARY KEY, mid INTEGER, flds TEXT,
+                                mod INTEGER, tags TEXT);
+            CREATE TABLE cards (id INTEGER PRIMARY KEY, nid INTEGER, did INTEGER,
+                                queue INTEGER, type INTEGER);
+            """)
+        self.mod = False
+
+    def execute(self, sql: str, *args):
+        return self.conn.execute(sql, args).fetchall()
+
+    def scalar(self, sql: str, *args):
+        row = self.conn.execute(sql, args).fetchone()
+        return row[0] if row else None
+
+    def list(self, sql: str, *args) -> list:
+        return [row[0] for row in self.conn.execute(sql, args)]
+
+
+class Models(object):
+    def __init__(self, col):
+        self.col = col
+
+    def all(self) -> List[dict]:
+        return [
+            {"id": mid, "flds": [{"name": name} for name in names]}
+            for mid, names in self.col.field_names.items()
+        ]
+
+
+class Decks(object):
+    def __init__(self):
+        self.decks = {str(DECK_ID): {"id": DECK_ID, "name": "Default"}}
+
+    def selected(self) -> int:
+        return DECK_ID
+
+
+class Media(object):
+    def __init__(self, media_dir: str):
+        self._dir = media_dir
+
+    def dir(self) -> str:
+        return self._dir
+
+
+class Collection(object):
+    def __init__(self, media_dir: str):
+        self.db = DB()
+        self.path = ":memory:"
+        self.mod = 0
+        self.field_names: Dict[int, List[str]] = {MODEL_ID: KOREAN_FIELDS}
+        self.models = Models(self)
+        self.decks = Decks()
+        self.media = Media(media_dir)
+        self.saves = 0
+
+    def add_notes(self, notes: Iterable[List[str]], mid: int = MODEL_ID, tags=""):
+        """Add notes, given as lists of fields, each with one new card."""
+        start = (self.db.scalar("SELECT max(id) FROM notes") or 0) + 1
+        rows = [
+            (nid, mid, "\x1f".join(fields), 0, tags)
+            for nid, fields in enumerate(notes, start)
+        ]
+        self.db.conn.executemany("INSERT INTO notes VALUES (?, ?, ?, ?, ?)", rows)
+        self.db.conn.executemany(
+            "INSERT INTO cards (nid, did, queue, type) VALUES (?, ?, 0, 0)",
+            [(row[0], DECK_ID) for row in rows],
+        )
+
+    def getNote(self, nid: int) -> Note:
+        mid, flds = self.db.conn.execute(
+            "SELECT mid, flds FROM notes WHERE id = ?", (nid,)
+        ).fetchone()
+        return Note(self, nid, mid, flds.split("\x1f"))
+
+    def save(self):
+        self.db.conn.commit()
+        self.mod += 1
+        self.saves += 1
+
+
+class Progress(object):
+    def start(self, *args, **kwargs):
+        pass
+
+    def update(self, *args, **kwargs):
+        pass
+
+    def finish(self):
+        pass
+
+    def busy(self) -> bool:
+        return False
+
+    def timer(self, ms, fn, repeat):
+        pass
+
+
+class ProfileManager(object):
+    def __init__(self, folder: str):
+        self.folder = folder
+
+    def profileFolder(self) -> str:
+        return self.folder
+
+
+class App(object):
+    def __init__(self):
+        # Windows with an `editor`, like the Browser, stand in for Anki's.
+        self.windows = []
+
+    def topLevelWidgets(self) -> list:
+        return list(self.windows)
+
+
+class AddonManager(object):
+    def __init__(self):
+        self.config = json.loads((ROOT_DIR / "config.json").read_text())
+
+    def getConfig(self, module: str) -> dict:
+        return dict(self.config)
+
+    def writeConfig(self, module: str, config: dict):
+        self.config = dict(config)
+
+    def setConfigUpdatedAction(self, module: str, action):
+        pass
+
+
+class MainWindow(object):
+    def __init__(self, media_dir: str):
+        self.col = Collection(media_dir)
+        self.progress = Progress()
+        self.addonManager = AddonManager()
+        self.app = App()
+        # The media folder is "collection.media" in the profile folder.
+        self.pm = ProfileManager(str(Path(media_dir).parent))
+        self.tooltips: List[str] = []
+        self.form = types.SimpleNamespace(menuTools=_Stub())
+
+    def checkpoint(self, name: str):
+        pass
+
+    def reset(self):
+        pass
+
+    def requireReset(self):
+        pass
+
+
+class Finder(object):
+    def __init__(self, col):
+        self.col = col
+
+    def findNotes(self, query: str) -> List[int]:
+        return self.col.db.list("SELECT id FROM notes ORDER BY id")
+
+
+class AnkiPackageImporter(object):
+    """Imports the notes of an .apkg, like Anki does, minus the scheduling."""
+
+    def __init__(self, col, path: str):
+        self.col = col
+        self.path = path
+
+    def run(self):
+        with zipfile.ZipFile(self.path) as package:
+            conn = sqlite3.connect(":memory:")
+            try:
+                data = package.read("collection.anki2")
+                conn.deserialize(data)
+            except AttributeError:
+                conn.close()
+                path = package.extract("collection.anki2", Path(self.path).parent)
+                conn = sqlite3.connect(path)
+            rows = conn.execute("SELECT flds FROM notes").fetchall()
+            conn.close()
+        self.col.add_notes(flds.split("\x1f") for (flds,) in rows)
+
+
+class _Stub(object):
+    """Stands in for any Qt class or object: every call and attribute is a no-op."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        return _Stub()
+
+    def __getattr__(self, name):
+        return _Stub()
+
+
+def _module(name: str, **attrs) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+
+def install(media_dir: str) -> MainWindow:
+    """
+    Install the fake `aqt`, `anki` and `PyQt5` modules, and return the fake
+    main window, `aqt.mw`. Installing again starts over with an empty
+    collection, in the same main window, since modules hold on to it.
+    """
+    aqt = sys.modules.get("aqt")
+    if isinstance(getattr(aqt, "mw", None), MainWindow):
+        aqt.mw.__init__(media_dir)
+        return aqt.mw
+    mw = MainWindow(media_dir)
+
+    def tooltip(text, *args, **kwargs):
+        mw.tooltips.append(text)
+
+    qt = _module("aqt.qt", pyqtSignal=lambda *args: _Stub())
+    qt.__getattr__ = lambda name: _Stub
+    core = _module("PyQt5.QtCore")
+    core.__getattr__ = lambda name: _Stub
+    _module("PyQt5", QtCore=core)
+    _module(
+        "aqt.utils",
+        showInfo=lambda *args, **kwargs: None,
+        askUserDialog=_Stub,
+        tooltip=tooltip,
+    )
+    _module("aqt", mw=mw, qt=qt)
+
+    def ids2str(ids) -> str:
+        return "(%s)" % ",".join(str(i) for i in ids)
+
+    utils = _module(
+        "anki.utils",
+        intTime=lambda scale=1: int(time.time() * scale),
+        ids2str=ids2str,
+        splitFields=lambda flds: flds.split("\x1f"),
+    )
+    find = _module("anki.find", Finder=Finder)
+    hooks = _module("anki.hooks", addHook=lambda name, fn: None)
+    stdmodels = _module("anki.stdmodels", models=[])
+    lang = _module("anki.lang", _=lambda text: text)
+    apkg = _module("anki.importing.apkg", AnkiPackageImporter=AnkiPackageImporter)
+    importing = _module("anki.importing", apkg=apkg)
+    _module(
+        "anki",
+        utils=utils,
+        find=find,
+        hooks=hooks,
+        stdmodels=stdmodels,
+        lang=lang,
+        importing=importing,
+    )
+    return mw
+
+
+def isolate(directory: Path):
+    """
+    Point the caches, fill journal and reports of jjigae at `directory`, so
+    that runs start cold and leave the add-on's user files alone. Call after
+    `install`.
+    """
+    from jjigae import augmentation, cache, core, instrumentation, prestudy, ui
+    from jjigae import journal, tts
+
+    directory.mkdir(parents=True, exist_ok=True)
+    old = augmentation.ndic_cache
+    augmentation.ndic_cache = core.ndic_cache = cache.Cache(
+        directory / "ndic.sqlite", ttl=old.ttl, negative_ttl=old.negative_ttl
+    )
+    prestudy.token_cache = ui.token_cache = cache.Cache(
+        directory / "tokens.sqlite", max_entries=prestudy.token_cache.max_entries
+    )
+    core.open_journal = lambda: journal.Journal(directory / "fill_journal.sqlite")
+    core.write_report = ui.write_report = partial(
+        instrumentation.write_report, directory=directory / "reports"
+    )
+    tts.MEDIA_DIR = None
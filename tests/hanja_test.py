@@ -0,0 +1,45 @@
+import sqlite3
+
+from jjigae import hanja
+
+
+def test_lookup_finds():
+    assert hanja.lookup("감정") == {"hanja": "感情"}
+
+
+def test_lookup_does_not_find():
+    assert hanja.lookup("없는단어") is None
+
+
+def test_lookup_many_matches_lookup():
+    words = ["감정", "가구", "과학", "없는단어"]
+    assert hanja.lookup_many(words) == {
+        word: hanja.lookup(word) for word in words if hanja.lookup(word) is not None
+    }
+
+
+def test_build_index_attaches_without_uris(tmp_path, monkeypatch):
+    monkeypatch.setattr(hanja, "USER_FILES_DIR", tmp_path)
+    monkeypatch.setattr(hanja, "index_path", tmp_path / "hanja_index.sqlite")
+    statements = []
+    connect = sqlite3.connect
+
+    def traced_connect(database, *args, **kwargs):
+        # Opened without uri=True, a "file:" ATTACH only works with SQLite
+        # built with SQLITE_USE_URI.
+        assert not kwargs.get("uri")
+        conn = connect(database, *args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(hanja.sqlite3, "connect", traced_connect)
+    hanja._build_index()
+    monkeypatch.setattr(hanja.sqlite3, "connect", connect)
+
+    attach = [s for s in statements if s.startswith("ATTACH")]
+    assert attach == [f"ATTACH DATABASE '{hanja.path}' AS dictionary"]
+    conn = sqlite3.connect(str(hanja.index_path))
+    assert conn.execute(
+        "SELECT hanja FROM hanjas WHERE hangul = ?", ("감정",)
+    ).fetchone() == ("感情",)
+    conn.close()
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from jjigae.instrumentation import Histogram, Metrics, profiled, write_report
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    for ms in [1] * 90 + [100] * 10:
+        histogram.record(ms / 1000)
+
+    assert histogram.count == 100
+    assert 0.001 <= histogram.percentile(0.5) < 0.002
+    assert histogram.percentile(0.99) == 0.1
+    assert histogram.to_dict()["max_ms"] == 100
+
+
+def test_timed_records_latency_and_errors():
+    metrics = Metrics()
+
+    def lookup(korean):
+        if not korean:
+            raise ValueError("empty")
+        return korean
+
+    timed = metrics.timed("ndic", lookup)
+    assert timed("감정") == "감정"
+    with pytest.raises(ValueError):
+        timed("")
+
+    report = metrics.report()
+    assert report["stages"]["ndic"]["count"] == 2
+    assert report["errors"] == {"ndic": 1}
+
+
+def test_write_report_keeps_latest(tmp_path):
+    paths = [write_report("fill", {"run": i}, tmp_path, keep=2) for i in range(3)]
+
+    assert sorted(tmp_path.glob("fill-*.json")) == paths[1:]
+    assert json.loads(paths[-1].read_text()) == {"run": 2}
+
+
+def test_profiled(tmp_path):
+    with profiled("fill", True, tmp_path) as profile:
+        sum(range(1000))
+    assert profile["profile"].endswith(".prof")
+    assert list(tmp_path.glob("fill-*.prof"))
+
+    with profiled("fill", False, tmp_path) as profile:
+        pass
+    assert profile["profile"] is None
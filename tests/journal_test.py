@@ -0,0 +1,64 @@
+from jjigae.journal import Journal
+
+
+def _journal(tmp_path, now):
+    return Journal(
+        tmp_path / "journal.sqlite", backoff=10, max_backoff=25, clock=lambda: now[0]
+    )
+
+
+def test_resumes_unfinished_run(tmp_path):
+    now = [1000.0]
+    journal = _journal(tmp_path, now)
+    run = journal.start("deck:1")
+    journal.record(run, 1, {})
+    journal.record(run, 2, {})
+    journal.commit()
+    journal.record(run, 3, {})
+    journal.close()  # before committing
+
+    journal = _journal(tmp_path, now)
+    assert journal.start("deck:1") == run
+    assert journal.processed(run) == {1, 2}
+    assert journal.start("deck:2") != run
+
+    journal.finish(run)
+    assert journal.start("deck:1") != run
+
+
+def test_retries_failures_with_backoff(tmp_path):
+    now = [1000.0]
+    journal = _journal(tmp_path, now)
+    run = journal.start("deck:1")
+    journal.record(run, 1, {"English": "IOError: offline", "Sound": "IOError: 503"})
+    journal.record(run, 2, {})
+    journal.commit()
+
+    assert journal.failures() == {
+        1: {"English": "IOError: offline", "Sound": "IOError: 503"}
+    }
+    assert journal.failures(due=True) == {}
+
+    now[0] += 10
+    assert set(journal.failures(due=True)) == {1}
+    journal.record(None, 1, {"English": "IOError: offline"})
+    assert journal.failures() == {1: {"English": "IOError: offline"}}
+
+    now[0] += 19
+    assert journal.failures(due=True) == {}
+    now[0] += 1
+    journal.record(None, 1, {"English": "IOError: offline"})
+    # Capped at max_backoff.
+    now[0] += 25
+    assert set(journal.failures(due=True)) == {1}
+
+    journal.record(None, 1, {})
+    assert journal.failures() == {}
+
+
+def test_forgets_deleted_notes(tmp_path):
+    journal = _journal(tmp_path, [0.0])
+    journal.record(None, 1, {"English": "x"})
+    journal.record(None, 2, {"English": "x"})
+    journal.forget([1])
+    assert set(journal.failures()) == {2}
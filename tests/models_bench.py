@@ -0,0 +1,66 @@
+"""
+Tracks the cost of building prestudy notes, against the local stand-ins for
+ndic and Google TTS, going through the real lookup and batched audio download.
+
+    python -m tests.models_bench [terms] [latency_ms]
+
+Needs `anki` and `aqt` to be importable, as `jjigae.models` registers the note
+type with Anki.
+"""
+
+import sys
+import tempfile
+import time
+import timeit
+from pathlib import Path
+
+from genanki import Note
+
+from jjigae import augmentation, models, prestudy, tts
+from jjigae.cache import Cache
+from tests.stand_ins import StandIns
+
+
+def _terms(n):
+    # Distinct words: `Term` drops the digits of a word.
+    return prestudy._vocab.get().terms[:n]
+
+
+def note_construction(number=2000):
+    fields = ["단어", "word", "", "", "_ _", ""]
+    shared = timeit.timeit(lambda: models.KoreanNote(fields=fields), number=number)
+    rebuilt = timeit.timeit(
+        lambda: Note(models.get_model.__wrapped__(), fields=fields), number=number
+    )
+    print(f"note construction: {shared / number * 1e6:.1f}µs shared model")
+    print(f"note construction: {rebuilt / number * 1e6:.1f}µs model rebuilt per note")
+
+
+def add_terms(n, latency):
+    terms = _terms(n)
+    for name, add in [
+        ("add_term", lambda deck: [deck.add_term(term) for term in terms]),
+        ("add_terms", lambda deck: deck.add_terms(terms)),
+    ]:
+        deck = models.ChineseDeck(1, "bench")
+        # Start every run with an empty dictionary cache and media folder.
+        with tempfile.TemporaryDirectory() as tmp, StandIns(latency) as services:
+            augmentation.ndic_cache = Cache(Path(tmp) / "ndic.sqlite")
+            tts.MEDIA_DIR = tmp
+            tts.refresh_manifest()
+            start = time.perf_counter()
+            add(deck)
+            elapsed = time.perf_counter() - start
+        print(
+            f"{name:>17}: {elapsed:.2f}s for {n} terms ({latency * 1000:.0f}ms), "
+            f"{sum(services.requests.values())} requests"
+        )
+
+
+def main(n=300, latency_ms=20):
+    note_construction()
+    add_terms(n, latency_ms / 1000)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,126 @@
+import importlib.util
+import os
+import zipfile
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent
+
+# Not `import package`, which would find the built package/ directory.
+spec = importlib.util.spec_from_file_location("package", ROOT_DIR / "package.py")
+package = importlib.util.module_from_spec(spec)
+cwd = os.getcwd()
+os.chdir(ROOT_DIR)
+try:
+    spec.loader.exec_module(package)
+finally:
+    os.chdir(cwd)
+
+
+def _tree(tmp_path):
+    directory = tmp_path / "package"
+    (directory / "lib").mkdir(parents=True)
+    (directory / "__init__.py").write_text("import lib\n")
+    (directory / "lib" / "__init__.py").write_text("x = 1\n" * 100)
+    (directory / "lib" / "data.txt").write_text("data")
+    return directory
+
+
+def _contents(path):
+    with zipfile.ZipFile(path) as archive:
+        assert archive.testzip() is None
+        return {name: archive.read(name) for name in archive.namelist()}
+
+
+def test_update_zip(tmp_path):
+    directory = _tree(tmp_path)
+    path = str(tmp_path / "package.ankiaddon")
+    assert package.update_zip(path, str(directory), []) == (3, 3)
+
+    (directory / "lib" / "data.txt").write_text("new data")
+    (directory / "extra.py").write_text("")
+    assert package.update_zip(path, str(directory), ["lib/data.txt"]) == (2, 4)
+    assert _contents(path) == {
+        "__init__.py": b"import lib\n",
+        "extra.py": b"",
+        "lib/__init__.py": b"x = 1\n" * 100,
+        "lib/data.txt": b"new data",
+    }
+
+    (directory / "extra.py").unlink()
+    assert package.update_zip(path, str(directory), ["lib"]) == (2, 3)
+    assert set(_contents(path)) == {"__init__.py", "lib/__init__.py", "lib/data.txt"}
+
+
+def test_reproducible_zip(tmp_path, monkeypatch):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1700000000")
+    directory = _tree(tmp_path)
+    first, second = str(tmp_path / "first.zip"), str(tmp_path / "second.zip")
+    package.update_zip(first, str(directory), [], reproducible=True)
+    os.utime(directory / "__init__.py", (0, 0))
+    package.update_zip(second, str(directory), [], reproducible=True)
+    assert Path(first).read_bytes() == Path(second).read_bytes()
+    with zipfile.ZipFile(first) as archive:
+        assert archive.infolist()[0].date_time == (2023, 11, 14, 22, 13, 20)
+
+
+def test_prune(tmp_path, monkeypatch):
+    monkeypatch.setattr(package, "PACKAGE_DIR", str(tmp_path))
+    files = [
+        "dep/__init__.py",
+        "dep/used.py",
+        "dep/unused.py",
+        "dep/data/words.txt",
+        "dep/sub/__init__.py",
+        "dep/sub/data.txt",
+        "dep/tests/test_dep.py",
+        "dep/speedups.c",
+    ]
+    for name in files:
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text("")
+    assert package.prune(["dep"], ["dep/__init__.py", "dep/used.py"]) == 5
+    assert package._walk(str(tmp_path)) == [
+        "dep/__init__.py",
+        "dep/data/words.txt",
+        "dep/used.py",
+    ]
+
+
+KONLPY_FILES = [
+    "konlpy/__init__.py",
+    "konlpy/jvm.py",
+    "konlpy/tag/__init__.py",
+    "konlpy/tag/_okt.py",
+    "konlpy/tag/_kkma.py",
+    "konlpy/java/open-korean-text-2.1.0.jar",
+    "konlpy/java/scala-library-2.12.3.jar",
+    "konlpy/java/twitter-text-1.14.7.jar",
+    "konlpy/java/kkma-2.0.jar",
+    "konlpy/java/bin/kr/lucypark/okt/OktInterface.class",
+    "konlpy/java/bin/kr/lucypark/kkma/KkmaInterface.class",
+    "konlpy/java/bin/kr/lucypark/kkma/KkmaInterface$1.class",
+    "konlpy/java/bin/kr/lucypark/komoran/KomoranInterface.class",
+    "konlpy/java/bin/kr/lucypark/jhannanum/comm/HannanumInterface.class",
+    "konlpy/java/data/kE/dic_system.txt",
+]
+
+
+def test_slim_zip_keeps_okt(tmp_path, monkeypatch):
+    directory = tmp_path / "package"
+    monkeypatch.setattr(package, "PACKAGE_DIR", str(directory))
+    for name in KONLPY_FILES:
+        (directory / name).parent.mkdir(parents=True, exist_ok=True)
+        (directory / name).write_text("")
+    # What importing konlpy.tag and building Okt imports.
+    modules = [name for name in KONLPY_FILES if name.endswith(".py")]
+    package.prune(["konlpy"], modules)
+    path = str(tmp_path / "package.ankiaddon")
+    package.update_zip(path, str(directory), [], bytecode=True)
+
+    names = set(_contents(path))
+    assert {name for name in names if name.startswith("konlpy/java/")} == {
+        "konlpy/java/bin/kr/lucypark/okt/OktInterface.class",
+        "konlpy/java/open-korean-text-2.1.0.jar",
+        "konlpy/java/scala-library-2.12.3.jar",
+        "konlpy/java/twitter-text-1.14.7.jar",
+    }
@@ -0,0 +1,67 @@
+"""
+Reports notes per second for "Fill missing" against local stand-in services.
+
+    python -m tests.pipeline_bench [notes] [latency_ms]
+"""
+
+import sys
+import time
+
+from jjigae.pipeline import FillPipeline
+
+
+def _stand_in(latency, result):
+    def service(korean):
+        time.sleep(latency)
+        return result(korean)
+
+    return service
+
+
+def _notes(n):
+    for i in range(n):
+        yield i, {
+            "Korean": f"<b>단어{i}</b>",
+            "English": "",
+            "Hanja": "",
+            "Silhouette": "",
+            "Sound": "",
+        }
+
+
+def _services(latency):
+    return dict(
+        cleanup=lambda txt: txt.replace("<b>", "").replace("</b>", "").strip(),
+        lookup=_stand_in(latency, lambda korean: f"english for {korean}"),
+        hanja=lambda koreans: {},
+        silhouette=lambda korean: "_" * len(korean),
+        tts=_stand_in(latency, lambda korean: f"{korean}_G_ko.mp3"),
+    )
+
+
+def sequential(n, latency):
+    services = _services(latency)
+    for _, note in _notes(n):
+        korean = services["cleanup"](note["Korean"])
+        note["English"] = services["lookup"](korean)
+        services["hanja"]([korean])
+        note["Silhouette"] = services["silhouette"](korean)
+        note["Sound"] = services["tts"](korean)
+
+
+def pipelined(n, latency):
+    for _ in FillPipeline(**_services(latency)).run(_notes(n)):
+        pass
+
+
+def main(n=200, latency_ms=20):
+    latency = latency_ms / 1000
+    for name, fn in [("sequential", sequential), ("pipelined", pipelined)]:
+        start = time.perf_counter()
+        fn(n, latency)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>10}: {n / elapsed:8.1f} notes/s ({n} notes, {latency_ms}ms)")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
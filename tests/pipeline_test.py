@@ -0,0 +1,141 @@
+import threading
+import time
+
+from jjigae.pipeline import FillPipeline, SingleFlight
+
+
+def _pipeline(**kwargs):
+    options = dict(
+        cleanup=lambda txt: (txt or "").strip(),
+        lookup=lambda korean: f"english for {korean}",
+        hanja=lambda koreans: {k: {"hanja": "感情"} for k in koreans if k == "감정"},
+        silhouette=lambda korean: "_ " * len(korean),
+        tts=lambda korean: f"{korean}_G_ko.mp3",
+    )
+    options.update(kwargs)
+    return FillPipeline(**options)
+
+
+def _note(korean, **fields):
+    note = {"Korean": korean, "English": "", "Hanja": "", "Silhouette": "", "Sound": ""}
+    note.update(fields)
+    return note
+
+
+def test_fills_missing_fields():
+    results = dict(_pipeline().run([(1, _note(" 감정 "))]))
+    assert results[1] == {
+        "Korean": "감정",
+        "English": "english for 감정",
+        "Hanja": "感情",
+        "Silhouette": "_ _ ",
+        "Sound": "감정_G_ko.mp3",
+    }
+
+
+def test_keeps_existing_fields():
+    results = dict(_pipeline().run([(1, _note("감정", English="feeling"))]))
+    assert results[1]["English"] == "feeling"
+
+
+def test_yields_every_note():
+    notes = [(i, _note(f"단어{i}")) for i in range(120)] + [(-1, {"Front": "x"})]
+    results = dict(_pipeline(batch_size=7).run(notes))
+    assert set(results) == {key for key, _ in notes}
+    assert results[-1] == {"Front": "x"}
+    assert all(results[i]["Sound"] == f"단어{i}_G_ko.mp3" for i in range(120))
+
+
+def test_respects_service_limits():
+    lock = threading.Lock()
+    active = {"now": 0, "max": 0}
+
+    def slow_lookup(korean):
+        with lock:
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+        time.sleep(0.01)
+        with lock:
+            active["now"] -= 1
+        return korean
+
+    engine = _pipeline(lookup=slow_lookup, max_workers=8, limits={"ndic": 2})
+    list(engine.run((i, _note(f"단어{i}")) for i in range(20)))
+    assert active["max"] <= 2
+
+
+def test_reports_errors():
+    def lookup(korean):
+        if korean == "감정":
+            raise IOError("offline")
+        return "person"
+
+    errors = []
+    engine = _pipeline(lookup=lookup)
+    results = dict(
+        engine.run(
+            [(1, _note("감정")), (2, _note("사람"))],
+            on_error=lambda key, field, e: errors.append((key, field, str(e))),
+        )
+    )
+    assert errors == [(1, "English", "offline")]
+    assert results[1]["English"] == ""
+    assert results[1]["Sound"] == "감정_G_ko.mp3"
+    assert results[2]["English"] == "person"
+
+
+def test_looks_up_each_word_once():
+    calls = []
+    lock = threading.Lock()
+
+    def lookup(korean):
+        with lock:
+            calls.append(korean)
+        time.sleep(0.01)
+        return f"english for {korean}"
+
+    hanja_calls = []
+
+    def hanja(koreans):
+        hanja_calls.extend(koreans)
+        return {}
+
+    notes = [(i, _note(["감정", " 감정", "사람"][i % 3])) for i in range(30)]
+    engine = _pipeline(lookup=lookup, hanja=hanja, batch_size=4)
+    results = dict(engine.run(notes))
+
+    assert sorted(calls) == ["감정", "사람"]
+    assert sorted(hanja_calls) == ["감정", "사람"]
+    assert all(
+        results[i]["English"] == f"english for {results[i]['Korean']}"
+        for i in range(30)
+    )
+    assert engine.lookups == {"ndic": 2, "tts": 2, "hanja": 2}
+    assert engine.saved == {"ndic": 28, "tts": 28, "hanja": 28}
+
+
+def test_shares_requests_in_flight():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return "감정"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do("k", fetch)))
+    leader.start()
+    started.wait()
+    follower = threading.Thread(target=lambda: results.append(flights.do("k", fetch)))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert calls == [1]
+    assert sorted(results) == [("감정", False), ("감정", True)]
@@ -1,8 +1,11 @@
+from collections import Counter
+
 from jjigae import prestudy
+from jjigae.cache import Cache
 
 
 def test_vocab_is_sorted_by_rank():
-    vocabs = prestudy._VOCAB[0:5]
+    vocabs = prestudy._vocab.get().terms[0:5]
     assert vocabs[0].rank < vocabs[-1].rank
 
 
@@ -51,3 +54,60 @@ def test_extract():
         min_difficulty="B",
     )
     assert {t.word for t in terms} == {"발전", "과학", "자유롭다", "예술", "권리", "참여"}
+
+
+def test_search_matches_scan():
+    for max_vocab in [500, 3500, 7000]:
+        terms = prestudy._vocab.get().terms
+        vocab = terms[:max_vocab]
+        for term in terms[::50]:
+            expected = next((t for t in vocab if t.word == term.word), None)
+            assert prestudy.search(term.word, max_vocab=max_vocab) is expected
+
+
+def test_split_sentences():
+    text = "첫 문장입니다. 두 번째 문장!\n\n세 번째 문장? 마지막"
+    assert list(prestudy.split_sentences(text)) == [
+        "첫 문장입니다.",
+        "두 번째 문장!",
+        "세 번째 문장?",
+        "마지막",
+    ]
+
+
+def test_chunks_group_sentences():
+    text = "가나다. " * 10
+    chunks = list(prestudy.chunks(text, chunk_size=10))
+    assert all(len(chunk) <= 10 for chunk in chunks)
+    assert " ".join(chunks) == text.strip()
+
+
+def test_tokenize_uses_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(prestudy, "token_cache", Cache(tmp_path / "tokens.sqlite"))
+    tokens = [("감정", "Noun"), ("을", "Josa"), ("표현", "Noun"), ("하다", "Verb")]
+    prestudy.token_cache.set(
+        prestudy._sentence_key("감정을  표현했다"), prestudy._encode_tokens(tokens)
+    )
+    assert prestudy.tokenize("감정을 표현했다") == tokens
+
+
+def test_coverage_learns_frequent_words_first():
+    counts = Counter({"예술": 1, "과학": 5, "권리": 3, "사람": 2, "없는단어": 1})
+    coverage = prestudy.Coverage(counts, prestudy.rank_words(set(counts), "B"))
+
+    assert [t.word for t in coverage.terms] == ["과학", "권리", "예술"]
+    assert coverage.baseline == 2 / 12
+    assert coverage.covered == [7 / 12, 10 / 12, 11 / 12]
+    assert coverage.study_count(0.1) == 0
+    assert coverage.study_count(0.5) == 1
+    assert coverage.study_count(0.8) == 2
+    assert coverage.study_count(1.0) == 3
+
+
+def test_coverage_counts_known_words():
+    counts = Counter({"과학": 5, "권리": 3, "없는단어": 2})
+    ranked = prestudy.rank_words({"과학"}, "B")
+    coverage = prestudy.Coverage(counts, ranked, known={"권리", "없는단어"})
+
+    assert coverage.baseline == 1 / 2
+    assert coverage.study_count(0.9) == 1
@@ -0,0 +1,134 @@
+"""
+Local HTTP stand-ins for the Naver dictionary and Google TTS, with configurable
+latency and error rate, so that tests and benchmarks never hit the network.
+
+    with StandIns(latency=0.02, error_rate=0.01) as services:
+        ...  # ndic.search and gTTS now talk to `services`
+"""
+
+import base64
+import random
+import threading
+import time
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import gtts.tts
+import ndic.utils
+
+TTS_PATH = "/_/TranslateWebserverUi/data/batchexecute"
+
+# Not a playable mp3, but gTTS doesn't care.
+AUDIO = base64.b64encode(b"ID3" + bytes(61)).decode("ascii")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, body: str, content_type: str):
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _failing(self) -> bool:
+        """
+        Wait out the latency, and drop the connection without responding
+        when this request is picked to fail, as a flaky network would.
+        """
+        time.sleep(self.server.latency)
+        if self.server.fail():
+            self.close_connection = True
+            return True
+        return False
+
+    def do_GET(self):
+        self.server.count("ndic")
+        if self._failing():
+            return
+        word = parse_qs(urlparse(self.path).query).get("query", [""])[0]
+        self._respond(
+            '<div class="word_num"><span class="fnt_k05">'
+            f"english for {escape(word)}</span></div>",
+            "text/html; charset=utf-8",
+        )
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.count("tts")
+        if self._failing():
+            return
+        self._respond(
+            ')]}\'\n\n[["wrb.fr","jQ1olc","[\\"' + AUDIO + '\\"]",null]]\n',
+            "application/json; charset=utf-8",
+        )
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency: float, error_rate: float, seed: int):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = {"ndic": 0, "tts": 0}
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def count(self, service: str):
+        with self._lock:
+            self.requests[service] += 1
+
+    def fail(self) -> bool:
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+            self.errors += failed
+            return failed
+
+
+class StandIns(object):
+    """
+    Serves both stand-ins from one local server, and points ndic and gTTS at
+    it while in use. Which requests fail is random, but repeatable for a given
+    `seed` and order of requests.
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.server = _Server(latency, error_rate, seed)
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, name="stand-ins", daemon=True
+        )
+        self._saved = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self) -> dict:
+        return dict(self.server.requests)
+
+    @property
+    def errors(self) -> int:
+        return self.server.errors
+
+    def __enter__(self) -> "StandIns":
+        self._thread.start()
+        self._saved = (ndic.utils.NAVER_ENDIC_URL, gtts.tts._translate_url)
+        ndic.utils.NAVER_ENDIC_URL = self.url + "/search.nhn?query={search_word}"
+        gtts.tts._translate_url = lambda tld="com", path="": f"{self.url}/{path}"
+        return self
+
+    def __exit__(self, *exc_info):
+        ndic.utils.NAVER_ENDIC_URL, gtts.tts._translate_url = self._saved
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,207 @@
+"""
+Benchmarks "Fill missing", prestudy extraction and adding prestudy notes end
+to end, against a fake Anki and local stand-ins for ndic and Google TTS, and
+writes the results as JSON, to track regressions across commits.
+
+    python -m tests.suite_bench
+    python -m tests.suite_bench --sizes 1000 --latency-ms 20 --error-rate 0.01
+
+Every run starts from cold caches. Notes and texts are generated from a fixed
+seed, so runs with the same settings do the same work.
+"""
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from tests import fake_anki
+from tests.stand_ins import StandIns
+
+ROOT_DIR = Path(__file__).parent.parent
+
+CORPUS = Path(__file__).parent / "fixtures" / "korean_corpus.txt"
+
+FILL_SIZES = [1000, 10000, 50000]
+
+# Characters of text to extract words from.
+TEXT_SIZES = [10000, 100000, 1000000]
+
+ADD_SIZES = [100, 500]
+
+BENCHMARKS = ["fill", "extract", "add_notes"]
+
+# Wrappings of the Korean field, as found in imported decks.
+WRAPPINGS = ["{}", "{}", "{}", "<b>{}</b>", "{}&nbsp;", "<div>{}</div>"]
+
+
+def _notes(n: int, words, rng: random.Random):
+    """
+    Synthetic notes for `words`, picked at random, some with their English
+    already filled in.
+    """
+    for _ in range(n):
+        word = rng.choice(words)
+        english = f"english for {word}" if rng.random() < 0.1 else ""
+        yield [rng.choice(WRAPPINGS).format(word), english, "", "", "", ""]
+
+
+def _text(size: int) -> str:
+    corpus = CORPUS.read_text()
+    return (corpus * (size // len(corpus) + 1))[:size]
+
+
+def _latest_report(directory: Path, kind: str) -> dict:
+    return json.loads(
+        sorted((directory / "reports").glob(f"{kind}-*.json"))[-1].read_text()
+    )
+
+
+def _stages(report: dict) -> dict:
+    return {
+        stage: {k: h[k] for k in ("count", "mean_ms", "p90_ms", "max_ms")}
+        for stage, h in report["stages"].items()
+    }
+
+
+def _setup(directory: Path):
+    media = directory / "media"
+    media.mkdir(parents=True)
+    mw = fake_anki.install(str(media))
+    fake_anki.isolate(directory)
+    return mw
+
+
+def bench_fill(n: int, args, directory: Path) -> dict:
+    from jjigae import core, prestudy
+
+    mw = _setup(directory)
+    words = [term.word for term in prestudy._vocab.get().terms]
+    mw.col.add_notes(_notes(n, words, random.Random(args.seed)))
+    with StandIns(args.latency_ms / 1000, args.error_rate, args.seed) as services:
+        start = time.perf_counter()
+        core.fill_missing()
+        seconds = time.perf_counter() - start
+    report = _latest_report(directory, "fill")
+    return dict(
+        seconds=seconds,
+        notes_per_second=n / seconds,
+        filled=report["notes"],
+        requests=services.requests,
+        failed_requests=services.errors,
+        lookups=report["lookups"],
+        saved_lookups=report["saved_lookups"],
+        caches=report["caches"],
+        stages=_stages(report),
+    )
+
+
+def bench_extract(size: int, args, directory: Path) -> dict:
+    from jjigae import prestudy
+
+    _setup(directory)
+    text = _text(size)
+    results = {}
+    for run in ("cold", "warm"):
+        start = time.perf_counter()
+        terms = prestudy.extract(text)
+        results[f"{run}_seconds"] = time.perf_counter() - start
+    results["terms"] = len(terms)
+    results["chars_per_second"] = size / results["cold_seconds"]
+    return results
+
+
+def bench_add_notes(n: int, args, directory: Path) -> dict:
+    from jjigae import prestudy, ui
+
+    mw = _setup(directory)
+    terms = prestudy._vocab.get().terms[:n]
+    with StandIns(args.latency_ms / 1000, args.error_rate, args.seed) as services:
+        start = time.perf_counter()
+        ui.add_notes(terms, "Default", ["bench"])
+        seconds = time.perf_counter() - start
+    added = mw.col.db.scalar("SELECT count() FROM notes")
+    return dict(
+        seconds=seconds,
+        notes_per_second=added / seconds,
+        added=added,
+        requests=services.requests,
+        failed_requests=services.errors,
+    )
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run(args) -> dict:
+    from jjigae import hanja, prestudy
+
+    suites = {
+        "fill": (bench_fill, args.sizes, "notes"),
+        "extract": (bench_extract, args.text_sizes, "chars"),
+        "add_notes": (bench_add_notes, args.add_sizes, "notes"),
+    }
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        fake_anki.install(tmp)
+        # Local resources are loaded once per session in Anki, so leave them
+        # out of the timings.
+        prestudy._vocab.get()
+        hanja.index.get()
+        for name in args.only:
+            bench, sizes, unit = suites[name]
+            for i, size in enumerate(sizes):
+                result = {"benchmark": name, unit: size}
+                try:
+                    result.update(bench(size, args, Path(tmp) / f"{name}-{i}"))
+                except Exception as e:
+                    result["error"] = f"{type(e).__name__}: {e}"
+                results.append(result)
+                print(json.dumps(result), flush=True)
+    return dict(
+        date=datetime.now().isoformat(timespec="seconds"),
+        commit=_commit(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        settings=dict(
+            latency_ms=args.latency_ms, error_rate=args.error_rate, seed=args.seed
+        ),
+        results=results,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m tests.suite_bench")
+    parser.add_argument("--sizes", type=int, nargs="+", default=FILL_SIZES)
+    parser.add_argument("--text-sizes", type=int, nargs="+", default=TEXT_SIZES)
+    parser.add_argument("--add-sizes", type=int, nargs="+", default=ADD_SIZES)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=Path("bench_results.json"))
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    args.output.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Compares the single-pass field sanitizer and the table-driven silhouette against
+their previous implementations.
+
+    python -m tests.text_bench
+"""
+
+import re
+import timeit
+
+from jjigae import text
+
+FIELDS = [
+    "감정",
+    "<div>감정&nbsp;</div>",
+    '<div><span style="font-family: Arial;">감정</span></div><br>',
+    "&nbsp;<b>feelings</b>, emotion<br><br>",
+    "{{c1::감정}}을 {{c2::<i>표현</i>::verb}}하다",
+    "[sound:감정_G_ko.mp3]",
+    "",
+    '<img src="paste-123.jpg"><div>&nbsp;</div>',
+]
+
+
+def legacy_cleanup(txt):
+    if not txt:
+        return ""
+    txt = re.sub(r"<.*?>", "", txt, flags=re.S)
+    txt = txt.replace("&nbsp;", " ")
+    txt = re.sub(r"^\s*", "", txt)
+    txt = re.sub(r"\s*$", "", txt)
+    txt = re.sub(r"\{\{c[0-9]+::(.*?)(::.*?)?\}\}", r"\1", txt)
+    return txt
+
+
+WORDS = ["감정", "사과 주스", "공동체의 문화생활에", "ㅋㅋ 웃겨!", "to 먹다"]
+
+
+def legacy_silhouette(hangul):
+    def insert_spaces(p):
+        r = ""
+        for i in p.group(0):
+            r += i + " "
+        return r[:-1]
+
+    hangul_unicode = "[\u1100-\u11ff|\uac00-\ud7af|\u3130-\u318f]"
+    hangul = re.sub("{}+".format(hangul_unicode), insert_spaces, hangul)
+    txt = re.sub(hangul_unicode, "_", hangul)
+    return txt
+
+
+def _report(name, elapsed, baseline, per, number):
+    print(
+        f"{name:>11}: {elapsed / number / per * 1e9:7.0f}ns per call "
+        f"({baseline / elapsed:.1f}x)"
+    )
+
+
+def main(number=20000):
+    # A fill run cleans the same few fields of every note several times.
+    fields = FIELDS * 9
+    legacy = timeit.timeit(lambda: [legacy_cleanup(f) for f in fields], number=number)
+    uncached = timeit.timeit(
+        lambda: [text.cleanup.__wrapped__(f) for f in fields], number=number
+    )
+    memoized = timeit.timeit(lambda: text.cleanup_many(fields), number=number)
+    print("cleanup")
+    for name, elapsed in [
+        ("legacy", legacy),
+        ("single pass", uncached),
+        ("memoized", memoized),
+    ]:
+        _report(name, elapsed, legacy, len(fields), number)
+
+    legacy = timeit.timeit(lambda: [legacy_silhouette(w) for w in WORDS], number=number)
+    table = timeit.timeit(lambda: [text.silhouette(w) for w in WORDS], number=number)
+    print("silhouette")
+    _report("legacy", legacy, legacy, len(WORDS), number)
+    _report("table", table, legacy, len(WORDS), number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+from jjigae.text import cleanup, cleanup_many, silhouette, silhouette_mode
+
+
+def test_cleanup_strips_html():
+    assert cleanup("<div><b>감정</b></div>") == "감정"
+    assert cleanup("<span\nclass='x'>감정</span>") == "감정"
+
+
+def test_cleanup_replaces_nbsp_and_trims():
+    assert cleanup("&nbsp; 감정&nbsp;표현 <br>\n") == "감정 표현"
+
+
+def test_cleanup_removes_clozes():
+    assert cleanup("{{c1::감정}}을 {{c2::표현::verb}}하다") == "감정을 표현하다"
+    assert cleanup("{{c1::<b>감정</b>}}") == "감정"
+
+
+def test_cleanup_empty():
+    assert cleanup(None) == ""
+    assert cleanup("") == ""
+    assert cleanup("<br>&nbsp;") == ""
+
+
+def test_cleanup_many():
+    assert cleanup_many(["<b>a</b>", "", "{{c1::b}}"]) == ["a", "", "b"]
+
+
+def test_silhouette():
+    assert silhouette("사과 주스") == "_ _ _ _"
+    assert silhouette("ㅋㅋ 웃겨!") == "_ _ _ _!"
+    assert silhouette("a|b 가나") == "a|b _ _"
+
+
+def test_silhouette_modes():
+    assert silhouette("강아지 좋아", "syllables") == "3 2"
+    assert silhouette("강아지 좋아", "jamo") == "3 2 2 3 2"
+    assert silhouette("강아지 좋아", "choseong") == "ㄱㅇㅈ ㅈㅇ"
+
+
+def test_silhouette_mode():
+    assert silhouette_mode({}) == "underscores"
+    assert silhouette_mode({"silhouette": "choseong"}) == "choseong"
+    assert silhouette_mode({"silhouette": "initials"}) == "underscores"
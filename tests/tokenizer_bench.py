@@ -0,0 +1,51 @@
+"""
+Shows how tokenization scales with the number of worker processes, on a large
+text built from the local Korean corpus fixture, and how much faster the same
+text goes once its sentences are in the token cache.
+
+    python -m tests.tokenizer_bench [sentences] [max_processes]
+
+Needs a JVM for Okt.
+"""
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from jjigae import prestudy
+from jjigae.cache import Cache
+
+CORPUS = Path(__file__).parent / "fixtures" / "korean_corpus.txt"
+
+
+def corpus(sentences):
+    lines = CORPUS.read_text(encoding="utf-8").split("\n")
+    lines = [line for line in lines if line]
+    # Number the sentences, so that they're all different and miss the cache.
+    return "\n".join(f"{i}번. {lines[i % len(lines)]}" for i in range(sentences))
+
+
+def main(sentences=5000, max_processes=os.cpu_count()):
+    text = corpus(sentences)
+    baseline = None
+    for processes in range(1, max_processes + 1):
+        with tempfile.TemporaryDirectory() as tmp:
+            prestudy.token_cache = Cache(Path(tmp) / "tokens.sqlite")
+            start = time.perf_counter()
+            prestudy.extract_words(text, processes=processes)
+            elapsed = time.perf_counter() - start
+            start = time.perf_counter()
+            prestudy.extract_words(text, processes=processes)
+            warm = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(
+            f"{processes:>2} processes: {elapsed:6.2f}s "
+            f"({sentences / elapsed:7.0f} sentences/s, {baseline / elapsed:.1f}x), "
+            f"cached: {warm:6.2f}s ({elapsed / warm:.0f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
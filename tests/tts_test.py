@@ -0,0 +1,77 @@
+import os
+
+import gtts.tts
+import pytest
+
+from jjigae import tts
+
+
+class FakeTTS(object):
+    saves = 0
+    fail = False
+
+    def __init__(self, text, lang="ko"):
+        self.text = text
+
+    def save(self, path):
+        FakeTTS.saves += 1
+        with open(path, "wb") as file:
+            file.write(b"partial")
+        if FakeTTS.fail:
+            raise OSError("connection reset")
+        with open(path, "ab") as file:
+            file.write(self.text.encode("utf-8"))
+
+
+@pytest.fixture
+def media(tmp_path, monkeypatch):
+    monkeypatch.setattr(tts, "MEDIA_DIR", str(tmp_path))
+    monkeypatch.setattr(tts, "BACKOFF", 0)
+    monkeypatch.setattr(gtts.tts, "gTTS", FakeTTS)
+    monkeypatch.setattr(FakeTTS, "saves", 0)
+    monkeypatch.setattr(FakeTTS, "fail", False)
+    tts.refresh_manifest()
+    yield tmp_path
+    tts.refresh_manifest()
+
+
+def test_refetches_empty_files(media):
+    (media / "감정_G_ko.mp3").write_bytes(b"")
+    (media / "사람_G_ko.mp3").write_bytes(b"audio")
+
+    assert tts.get_word_from_google("감정") == "감정_G_ko.mp3"
+    assert tts.get_word_from_google("사람") == "사람_G_ko.mp3"
+    assert FakeTTS.saves == 1
+    assert (media / "감정_G_ko.mp3").stat().st_size > 0
+
+
+def test_failed_download_leaves_no_files(media):
+    FakeTTS.fail = True
+    with pytest.raises(RuntimeError):
+        tts.get_word_from_google("감정")
+    assert FakeTTS.saves == 3
+    assert os.listdir(media) == []
+
+
+def test_refresh_forgets_deleted_files(media):
+    tts.get_word_from_google("감정")
+    (media / "감정_G_ko.mp3").unlink()
+    tts.refresh_manifest()
+
+    tts.get_word_from_google("감정")
+    assert FakeTTS.saves == 2
+    assert (media / "감정_G_ko.mp3").exists()
+
+
+def test_checks_only_looked_up_files(media, monkeypatch):
+    for i in range(100):
+        (media / f"{i}_G_ko.mp3").write_bytes(b"audio")
+    stats = []
+    stat = os.stat
+    monkeypatch.setattr(tts.os, "stat", lambda path: stats.append(path) or stat(path))
+
+    for _ in range(2):
+        assert tts.get_word_from_google("1") == "1_G_ko.mp3"
+        assert tts.get_word_from_google("2") == "2_G_ko.mp3"
+    assert len(stats) == 2
+    assert FakeTTS.saves == 0
@@ -0,0 +1,89 @@
+"""
+Compares loading the vocab from the CSV and from the compiled store, and the
+indexed vocab lookups against a linear scan of the vocab.
+
+    python -m jjigae.vocab_store
+    python -m tests.vocab_bench
+"""
+
+import timeit
+import tracemalloc
+
+from jjigae import prestudy, vocab_store
+
+MAX_VOCABS = [500, 1000, 2000, 3500, 5000, 7000]
+
+WORDS = ["감정", "사람", "과학", "권리", "없는단어"]
+
+
+VOCAB = prestudy._vocab.get()
+
+
+def scan_search(word, max_vocab):
+    return next((term for term in VOCAB.terms[:max_vocab] if term.word == word), None)
+
+
+def scan_extract(words, max_vocab, min_difficulty):
+    return {
+        term
+        for term in VOCAB.terms[:max_vocab]
+        if term.word in words and prestudy.at_least_difficulty(min_difficulty, term)
+    }
+
+
+def indexed_extract(words, max_vocab, min_difficulty):
+    # Same as prestudy.extract, minus the tokenization.
+    min_level = prestudy._min_level(min_difficulty)
+    terms = set()
+    for word in words:
+        for position in VOCAB.index.get(word, ()):
+            if position >= max_vocab:
+                break
+            if VOCAB.levels[position] >= min_level:
+                terms.add(VOCAB.terms[position])
+    return terms
+
+
+def _time(fn, number):
+    return timeit.timeit(fn, number=number) / number * 1e6
+
+
+def _load(loader):
+    tracemalloc.start()
+    vocab = prestudy.Vocab(loader())
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del vocab
+    return size / 1024, peak / 1024
+
+
+def bench_load(number=20):
+    print("load          time (ms)  retained (KiB)  peak (KiB)")
+    for name, loader in [("csv", prestudy._load_csv), ("compiled", vocab_store.load)]:
+        seconds = _time(lambda: prestudy.Vocab(loader()), number) / 1000
+        size, peak = _load(loader)
+        print(f"{name:<10} {seconds:>12.1f} {size:>15.0f} {peak:>11.0f}")
+    print()
+
+
+def main(number=200):
+    bench_load()
+    words = {term.word for term in VOCAB.terms[::20]}
+    print("max_vocab  search: scan / indexed  extract: scan / indexed  (µs)")
+    for max_vocab in MAX_VOCABS:
+        search_scan, search_indexed = [
+            _time(lambda: [fn(word, max_vocab) for word in WORDS], number)
+            for fn in (scan_search, prestudy.search)
+        ]
+        extract_scan, extract_indexed = [
+            _time(lambda: fn(words, max_vocab, "B"), number)
+            for fn in (scan_extract, indexed_extract)
+        ]
+        print(
+            f"{max_vocab:>9} {search_scan:>14.1f} / {search_indexed:<7.1f}"
+            f" {extract_scan:>15.1f} / {extract_indexed:<7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
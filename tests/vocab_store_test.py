@@ -0,0 +1,50 @@
+import pytest
+
+from jjigae import prestudy, vocab_store
+
+
+def _fields(term):
+    return [getattr(term, name) for name in prestudy.Term.__slots__]
+
+
+def test_load_matches_csv(tmp_path):
+    terms = prestudy._load_csv()
+    out = tmp_path / "vocab.bin"
+    vocab_store.compile_vocab(terms, out)
+
+    loaded = vocab_store.load(out)
+
+    assert [_fields(t) for t in loaded] == [_fields(t) for t in terms]
+
+
+def test_load_rejects_stale_file(tmp_path):
+    source = tmp_path / "vocab.csv"
+    source.write_text("순위,단어,품사,풀이,등급\n1,가게,명,,A\n")
+    out = tmp_path / "vocab.bin"
+    vocab_store.compile_vocab(prestudy._load_csv()[:10], out, source)
+    source.write_text("순위,단어,품사,풀이,등급\n1,가게,명,,A\n2,가격,명,價格,B\n")
+
+    with pytest.raises(ValueError):
+        vocab_store.load(out, source)
+
+
+def test_load_rejects_same_size_edit(tmp_path):
+    source = tmp_path / "vocab.csv"
+    source.write_text("순위,단어,품사,풀이,등급\n1,가게,명,,A\n")
+    out = tmp_path / "vocab.bin"
+    vocab_store.compile_vocab(prestudy._load_csv()[:10], out, source)
+    source.write_text("순위,단어,품사,풀이,등급\n1,가격,명,,A\n")
+
+    with pytest.raises(ValueError):
+        vocab_store.load(out, source)
+
+
+def test_load_long_strings(tmp_path):
+    terms = prestudy._load_csv()[:3]
+    terms[1].notes = "설명 " * 200
+    out = tmp_path / "vocab.bin"
+    vocab_store.compile_vocab(terms, out)
+
+    loaded = vocab_store.load(out)
+
+    assert [_fields(t) for t in loaded] == [_fields(t) for t in terms]